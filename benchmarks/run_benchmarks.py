@@ -0,0 +1,211 @@
+"""
+Times LLM-Sherpa's hot paths on synthetic projects and writes the results as JSON.
+
+Each case generates (or reuses) a synthetic tree and drives a real ProjectDocumenter window under Qt's offscreen
+platform: scanning with FileSystemWorker, populating the tree model, check toggling through on_item_changed,
+token counting, update_token_count and generate_markdown. Settings are the defaults, kept in a temporary
+settings file, and the app's config is redirected to Qt's test location, so neither the user's settings.json nor
+their config is read or written.
+
+    python benchmarks/run_benchmarks.py --files 1000 50000 --shape wide deep -o results.json
+    python benchmarks/run_benchmarks.py --baseline results.json
+
+With --baseline, the run fails (exit code 1) if any timing's median is more than --tolerance slower than the
+baseline's median for the same case.
+"""
+import os
+import sys
+import json
+import time
+import random
+import platform
+import argparse
+import tempfile
+import statistics
+import importlib.util
+from types import SimpleNamespace
+
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_DIR = os.path.dirname(BENCH_DIR)
+sys.path.insert(0, REPO_DIR); sys.path.insert(0, BENCH_DIR)
+
+from synthetic_repo import generate_repo, SHAPES  # noqa: E402
+
+from PySide6 import __version__ as PYSIDE_VERSION  # noqa: E402
+from PySide6.QtWidgets import QApplication  # noqa: E402
+from PySide6.QtCore import Qt, QEventLoop, QTimer, QStandardPaths  # noqa: E402
+
+def load_app_module():
+    """
+    Imports llm-sherpa.py, whose file name is not a valid module name.
+    """
+    spec = importlib.util.spec_from_file_location("llm_sherpa", os.path.join(REPO_DIR, "llm-sherpa.py"))
+    module = importlib.util.module_from_spec(spec); spec.loader.exec_module(module)
+    return module
+
+def wait_until(condition, timeout=3600):
+    """
+    Runs the Qt event loop in 5 ms slices until condition() is true.
+    """
+    deadline = time.perf_counter() + timeout
+    while not condition():
+        if time.perf_counter() > deadline: raise TimeoutError("benchmark step did not finish in time")
+        loop = QEventLoop(); QTimer.singleShot(5, loop.quit); loop.exec()
+
+class Timings:
+    """
+    Collects named timings (seconds) over repeated runs of one case.
+    """
+    def __init__(self): self.samples = {}
+    def add(self, name, seconds): self.samples.setdefault(name, []).append(seconds)
+    def time(self, name, func, *args):
+        start = time.perf_counter(); result = func(*args); self.add(name, time.perf_counter() - start)
+        return result
+    def summary(self):
+        return {name: {"median": statistics.median(values), "min": min(values), "max": max(values), "runs": len(values)} for name, values in self.samples.items()}
+
+def run_case(app_module, window, project_path, timings, output_file, toggles=200, seed=0):
+    """
+    One pass over every measured step for one project.
+    """
+    settings = window.settings_manager.settings
+
+    # Scanning alone: the worker runs on this thread. Batches are emitted from the scanner's pool threads, so
+    # they are collected through a direct connection rather than queued until after the scan.
+    batches = []
+    worker = app_module.FileSystemWorker(project_path, settings)
+    worker.batch_ready.connect(batches.append, Qt.DirectConnection)
+    timings.time("scan", worker.scanner.run)
+    entries = sum(len(batch) for batch in batches)
+
+    # Tree population alone, from the collected batches
+    model = window.tree_model
+    def populate():
+        model.reset(project_path)
+        for batch in batches: model.append_entries(batch)
+    timings.time("populate_tree", populate)
+
+    # The whole GUI path: threaded scan streaming into the tree, then watching and totals
+    start = time.perf_counter()
+    window.load_project(project_path)
+    wait_until(lambda: window.worker_thread is None)
+    timings.add("load_project", time.perf_counter() - start)
+
+    # Checking everything goes through on_item_changed once; counting finishes on the token counter's pool
+    window.token_counter.clear()
+    start = time.perf_counter()
+    model.set_checked(model.root, True)
+    timings.add("check_all", time.perf_counter() - start)
+    wait_until(lambda: not window._pending_tokens)
+    timings.add("count_tokens", time.perf_counter() - start)
+
+    start = time.perf_counter()
+    for _ in range(100): window.update_token_count()
+    timings.add("update_token_count", (time.perf_counter() - start) / 100)
+
+    # Single-file toggles, as when a user clicks through the tree (the counts are memoized by now)
+    files = list(model.iter_files())
+    picks = random.Random(seed).sample(files, min(toggles, len(files)))
+    start = time.perf_counter()
+    for node in picks: model.set_checked(node, False)
+    for node in picks: model.set_checked(node, True)
+    wait_until(lambda: not window._pending_tokens)
+    timings.add("toggle_file", (time.perf_counter() - start) / max(1, 2 * len(picks)))
+
+    start = time.perf_counter()
+    model.set_checked(model.root, False)
+    timings.add("uncheck_all", time.perf_counter() - start)
+    start = time.perf_counter()
+    model.set_checked(model.root, True)
+    wait_until(lambda: not window._pending_tokens)
+    timings.add("check_all_memoized", time.perf_counter() - start)
+
+    # Generation runs on its own thread; the save dialog and message boxes are stubbed out
+    start = time.perf_counter()
+    window.generate_markdown()
+    wait_until(lambda: window.generation_thread is None)
+    timings.add("generate_markdown", time.perf_counter() - start)
+
+    return {"entries": entries, "selected_files": model.root.checked_count, "tokens": int(window._selected_tokens_total), "output_bytes": os.path.getsize(output_file) if os.path.exists(output_file) else 0}
+
+def compare(results, baseline, tolerance):
+    """
+    Returns a list of "case/step: old -> new" strings for medians that got more than `tolerance` slower.
+    """
+    old_cases = {case["name"]: case for case in baseline.get("cases", [])}
+    regressions = []
+    for case in results["cases"]:
+        old = old_cases.get(case["name"])
+        if old is None: continue
+        for step, stats in case["timings"].items():
+            old_stats = old["timings"].get(step)
+            if old_stats and stats["median"] > old_stats["median"] * (1 + tolerance):
+                regressions.append(f"{case['name']}/{step}: {old_stats['median']:.4f}s -> {stats['median']:.4f}s")
+    return regressions
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark LLM-Sherpa on synthetic projects and write the timings as JSON.")
+    parser.add_argument("--files", type=int, nargs="+", default=[1000, 10000], help="File counts to test (default: 1000 10000)")
+    parser.add_argument("--shape", nargs="+", choices=sorted(SHAPES), default=["wide", "deep"], help="Folder layouts to test (default: wide deep)")
+    parser.add_argument("--seed", type=int, default=0, help="Seed for the synthetic trees (default: 0)")
+    parser.add_argument("--repeat", type=int, default=3, help="Runs per case; medians are compared (default: 3)")
+    parser.add_argument("--workdir", default=os.path.join(tempfile.gettempdir(), "llm-sherpa-bench"), help="Where synthetic trees are generated and kept between runs")
+    parser.add_argument("--vocab", default="", help="tiktoken-format vocabulary file for exact token counts (default: estimate)")
+    parser.add_argument("-o", "--output", help="Write the JSON results to this file (default: stdout)")
+    parser.add_argument("--baseline", help="Earlier results to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="Allowed slowdown against the baseline (default: 0.25)")
+    args = parser.parse_args(argv)
+
+    QStandardPaths.setTestModeEnabled(True)
+    sys.argv = sys.argv[:1]  # ProjectDocumenter would open a folder given on the command line
+    app = QApplication.instance() or QApplication([])
+    app.setOrganizationName("LLMSherpaOrg"); app.setApplicationName("LLMSherpaBench")
+    app_module = load_app_module()
+    output_file = os.path.join(args.workdir, "output_context.md")
+    app_module.QFileDialog = SimpleNamespace(getSaveFileName=lambda *a, **k: (output_file, ""))
+    def fail(parent, title, message): raise RuntimeError(f"{title}: {message}")
+    app_module.QMessageBox = SimpleNamespace(information=lambda *a, **k: None, warning=fail, critical=fail)
+
+    # The window reads and saves its settings through SettingsManager; point it at a fresh file of defaults
+    settings_dir = tempfile.TemporaryDirectory(prefix="llm-sherpa-bench-")
+    settings_manager_class = app_module.SettingsManager
+    app_module.SettingsManager = lambda: settings_manager_class(os.path.join(settings_dir.name, "settings.json"))
+
+    window = app_module.ProjectDocumenter()
+    settings = window.settings_manager.settings
+    settings.update(use_scan_index=False, restore_tree_selection=False, tokenizer_vocab_file=args.vocab)
+    window.token_counter.shutdown(); window.token_counter = app_module.TokenCounter(app_module.load_tokenizer(settings), settings=settings)
+
+    results = {
+        "meta": {"timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"), "python": platform.python_version(), "pyside6": PYSIDE_VERSION, "platform": platform.platform(), "cpus": os.cpu_count(), "tokenizer": window.token_counter.tokenizer.name, "repeat": args.repeat},
+        "cases": [],
+    }
+    for files in args.files:
+        for shape in args.shape:
+            project_path = os.path.join(args.workdir, f"{shape}_{files}_s{args.seed}")
+            start = time.perf_counter(); info = generate_repo(project_path, files, shape, args.seed)
+            print(f"{shape} {files:,}: {info['directories']:,} folders, {info['bytes'] / (1024 * 1024):.1f} MB (ready in {time.perf_counter() - start:.1f}s)", file=sys.stderr)
+            timings = Timings()
+            for _ in range(args.repeat): counts = run_case(app_module, window, project_path, timings, output_file, seed=args.seed)
+            results["cases"].append({"name": f"{shape}_{files}", "files": files, "shape": shape, "seed": args.seed, "directories": info["directories"], "bytes": info["bytes"], "counts": counts, "timings": timings.summary()})
+            for step, stats in timings.summary().items(): print(f"  {step:<20} {stats['median'] * 1000:10.2f} ms", file=sys.stderr)
+    window.close(); settings_dir.cleanup()
+
+    try:
+        import resource
+        results["meta"]["max_rss_mb"] = round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+    except ImportError: pass
+    if args.output:
+        with open(args.output, "w") as f: json.dump(results, f, indent=2)
+    else: print(json.dumps(results, indent=2))
+
+    if args.baseline:
+        with open(args.baseline, "r") as f: regressions = compare(results, json.load(f), args.tolerance)
+        for line in regressions: print(f"Regression: {line}", file=sys.stderr)
+        if regressions: return 1
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,121 @@
+"""
+Generates synthetic project trees for the benchmarks.
+
+The same (files, shape, seed) always produces the same tree: folder layout, file names, extensions, sizes and
+content all come from one seeded random generator. Trees are cached, so a generated tree is reused as long as
+its marker file is present.
+"""
+import os
+import sys
+import json
+import random
+import shutil
+import argparse
+
+# (subfolders per folder, files per folder) of each layout; files are spread evenly over all folders, so the
+# tree gets deeper as the file count grows. "flat" puts everything in the root.
+SHAPES = {"wide": (32, 40), "deep": (2, 8), "flat": (0, 0)}
+
+# Extension -> relative weight; the last few are not in the default extension map and never reach the document
+EXTENSIONS = {".py": 30, ".js": 14, ".json": 8, ".md": 8, ".txt": 5, ".html": 4, ".css": 4, ".yml": 3, ".toml": 2, ".sql": 2, ".sh": 2, ".png": 6, ".o": 4, ".ts": 8}
+# File size in bytes -> relative weight (about 3 KB on average)
+SIZES = {200: 40, 1000: 35, 4000: 17, 16000: 7, 64000: 1}
+# Folders the default settings exclude; a few of them are sprinkled in so exclusion is exercised
+EXCLUDED_DIRS = ("node_modules", "__pycache__", ".git", "venv")
+
+MARKER_FILE = ".synthetic_repo.json"
+
+_WORDS = ("data", "value", "result", "config", "item", "node", "parse", "load", "cache", "index", "token", "path", "user", "query", "state", "event", "buffer", "handler", "render", "update")
+
+def _text_line(rng, ext):
+    a, b, c = rng.choice(_WORDS), rng.choice(_WORDS), rng.randrange(1000)
+    if ext == ".py": return f"def {a}_{b}_{c}(self, {b}):\n    return self.{a}.get({b!r}, {c})\n"
+    if ext in (".js", ".ts"): return f"export function {a}{b.title()}{c}({b}) {{ return {a}[{b}] ?? {c}; }}\n"
+    if ext == ".json": return f'{{"{a}": "{b}", "id": {c}}},\n'
+    if ext == ".sql": return f"SELECT {a}, {b} FROM t_{c} WHERE {a} > {c};\n"
+    if ext in (".yml", ".toml"): return f"{a}_{c} = \"{b}\"\n"
+    if ext == ".css": return f".{a}-{b} {{ margin: {c % 64}px; }}\n"
+    if ext == ".html": return f"<div class=\"{a}\">{b} {c}</div>\n"
+    return f"{a.title()} {b} {c}: the {b} {a} is updated when {rng.choice(_WORDS)} changes.\n"
+
+def _content_pool(rng, ext, variants=16):
+    """
+    A few long blobs per extension that file contents are sliced from, which keeps generation fast.
+    """
+    if ext in (".png", ".o"): return [bytes(rng.randrange(256) for _ in range(4096)) * 16 for _ in range(4)]
+    blobs = []
+    for _ in range(variants):
+        text = "".join(_text_line(rng, ext) for _ in range(1200))
+        while len(text) < max(SIZES): text += text
+        blobs.append(text.encode("utf-8"))
+    return blobs
+
+def _directories(shape, files):
+    """
+    Relative folder paths for a shape, parents before children (breadth-first).
+    """
+    fanout, per_dir = SHAPES[shape]
+    target = files // per_dir if per_dir else 1
+    dirs, level, depth = [""], [""], 0
+    while fanout and len(dirs) < target:
+        level = [os.path.join(parent, f"{'pkg' if depth % 2 == 0 else 'mod'}{i:02d}") for parent in level for i in range(fanout)]
+        dirs.extend(level[:target - len(dirs)]); depth += 1
+    return dirs
+
+def generate_repo(root, files=1000, shape="wide", seed=0):
+    """
+    Writes a synthetic project with `files` files below `root` (created, or replaced if it holds a different
+    tree) and returns a dict describing it. Returns straight away if `root` already holds this tree.
+    """
+    spec = {"files": files, "shape": shape, "seed": seed}
+    marker = os.path.join(root, MARKER_FILE)
+    try:
+        with open(marker, "r") as f:
+            existing = json.load(f)
+        if all(existing.get(key) == value for key, value in spec.items()): return existing
+        shutil.rmtree(root)
+    except (FileNotFoundError, json.JSONDecodeError):
+        # Never delete a folder this module did not generate
+        if os.path.isdir(root) and os.listdir(root): raise ValueError(f"{root} is not empty and was not generated by synthetic_repo")
+    os.makedirs(root, exist_ok=True)
+
+    rng = random.Random(seed)
+    exts, ext_weights = list(EXTENSIONS), list(EXTENSIONS.values())
+    sizes, size_weights = list(SIZES), list(SIZES.values())
+    pools = {ext: _content_pool(rng, ext) for ext in exts}
+    dirs = _directories(shape, files)
+    for rel in dirs[1:]: os.makedirs(os.path.join(root, rel))
+    excluded = set(rng.sample(range(1, len(dirs)), min(len(dirs) - 1, max(1, len(dirs) // 50)))) if len(dirs) > 1 else set()
+    for index in excluded: os.makedirs(os.path.join(root, dirs[index], EXCLUDED_DIRS[index % len(EXCLUDED_DIRS)]))
+
+    total_bytes = 0
+    for n in range(files):
+        index = n % len(dirs); rel_dir = dirs[index]
+        if index in excluded and n % 3 == 0: rel_dir = os.path.join(rel_dir, EXCLUDED_DIRS[index % len(EXCLUDED_DIRS)])
+        ext = rng.choices(exts, ext_weights)[0]; size = rng.choices(sizes, size_weights)[0]
+        blob = rng.choice(pools[ext]); start = rng.randrange(len(blob) - size)
+        path = os.path.join(root, rel_dir, f"{rng.choice(_WORDS)}_{n:06d}{ext}")
+        with open(path, "wb") as f:
+            # A per-file first line keeps contents distinct, so deduplication does not hide the real work
+            if ext not in (".png", ".o"): f.write(f"# {path[len(root) + 1:]}\n".encode("utf-8"))
+            f.write(blob[start:start + size])
+        total_bytes += size
+
+    info = dict(spec, directories=len(dirs), bytes=total_bytes)
+    with open(marker, "w") as f:
+        json.dump(info, f)
+    return info
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Generate a synthetic project tree for benchmarking.")
+    parser.add_argument("root", help="Folder to write the tree to (replaced if it holds a different tree)")
+    parser.add_argument("--files", type=int, default=1000, help="Number of files (default: 1000)")
+    parser.add_argument("--shape", choices=sorted(SHAPES), default="wide", help="Folder layout (default: wide)")
+    parser.add_argument("--seed", type=int, default=0, help="Random seed (default: 0)")
+    args = parser.parse_args(argv)
+    info = generate_repo(args.root, args.files, args.shape, args.seed)
+    print(f"{info['files']:,} files in {info['directories']:,} folders ({info['bytes'] / (1024 * 1024):.1f} MB) at {args.root}")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,1656 @@
+"""
+Qt-free core of LLM-Sherpa: project scanning, selection and Markdown generation.
+
+Importable as a library and runnable as a command line tool (`python sherpa_core.py --help`);
+the GUI in llm-sherpa.py builds on the same functions.
+"""
+import os
+import sys
+import json
+import ast
+import math
+import re
+import time
+import zlib
+import mmap
+import base64
+import struct
+import hashlib
+import functools
+import fnmatch
+import argparse
+import operator
+import itertools
+import threading
+import contextlib
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, as_completed, wait, FIRST_COMPLETED
+from bisect import bisect_right
+from collections import OrderedDict, deque
+import ctypes
+from ctypes import wintypes
+
+# --- Helper Function (Unchanged) ---
+def get_long_path_name(short_path):
+    # ... (code is identical, no changes needed) ...
+    if sys.platform != 'win32': return short_path
+    try:
+        _GetLongPathNameW = ctypes.windll.kernel32.GetLongPathNameW
+        _GetLongPathNameW.argtypes = [wintypes.LPCWSTR, wintypes.LPWSTR, wintypes.DWORD]
+        _GetLongPathNameW.restype = wintypes.DWORD
+        buffer_size = _GetLongPathNameW(short_path, None, 0)
+        if buffer_size == 0: return short_path
+        long_path_buffer = ctypes.create_unicode_buffer(buffer_size)
+        result = _GetLongPathNameW(short_path, long_path_buffer, buffer_size)
+        if result == 0: return short_path
+        return long_path_buffer.value
+    except Exception: return short_path
+
+# --- Instrumentation ---
+class _NullSpan:
+    __slots__ = ()
+    def __enter__(self): return self
+    def __exit__(self, *exc_info): return False
+
+_NULL_SPAN = _NullSpan()
+
+class _Span:
+    __slots__ = ('profiler', 'name', 'args', 'start')
+    def __init__(self, profiler, name, args): self.profiler = profiler; self.name = name; self.args = args
+    def __enter__(self): self.start = time.perf_counter_ns(); return self
+    def __exit__(self, *exc_info): self.profiler._record(self.name, self.start, time.perf_counter_ns() - self.start, self.args); return False
+
+class Profiler:
+    """
+    Opt-in timing spans and counters around the hot paths, exportable as a Chrome trace (chrome://tracing or
+    ui.perfetto.dev). While disabled, `span` hands out one shared no-op context manager and `count` returns
+    straight away, so the instrumentation costs next to nothing. Thread-safe.
+    """
+    def __init__(self, max_events=500000):
+        self.enabled = False; self._lock = threading.Lock(); self._events = deque(maxlen=max_events); self._thread_names = {}
+        self.clear()
+    def enable(self, enabled=True): self.enabled = bool(enabled)
+    def clear(self):
+        with self._lock: self._events.clear(); self.totals = {}; self.counters = {}; self._origin = time.perf_counter_ns()
+    def span(self, name, **args):
+        """
+        Context manager timing one occurrence of `name`; keyword arguments are shown with it in the trace.
+        """
+        return _Span(self, name, args) if self.enabled else _NULL_SPAN
+    def timed(self, name):
+        """
+        Decorator timing every call of a function as the span `name`.
+        """
+        def decorate(func):
+            @functools.wraps(func)
+            def wrapper(*args, **kwargs):
+                if not self.enabled: return func(*args, **kwargs)
+                with _Span(self, name, {}): return func(*args, **kwargs)
+            return wrapper
+        return decorate
+    def count(self, name, n=1):
+        """
+        Adds `n` to the counter `name`.
+        """
+        if not self.enabled: return
+        thread_id = threading.get_ident(); now = time.perf_counter_ns()
+        with self._lock:
+            value = self.counters[name] = self.counters.get(name, 0) + n
+            self._events.append(('C', name, now, value, thread_id))
+    def _record(self, name, start, duration, args):
+        thread_id = threading.get_ident()
+        if thread_id not in self._thread_names: self._thread_names[thread_id] = threading.current_thread().name
+        with self._lock:
+            total = self.totals.get(name)
+            if total is None: self.totals[name] = [1, duration]
+            else: total[0] += 1; total[1] += duration
+            self._events.append(('X', name, start, duration, thread_id, args))
+    def snapshot(self):
+        """
+        Returns ({span: (calls, seconds)}, {counter: value}) so far.
+        """
+        with self._lock: return {name: (calls, ns / 1e9) for name, (calls, ns) in self.totals.items()}, dict(self.counters)
+    def export_chrome_trace(self, path):
+        """
+        Writes everything recorded since the last clear() in the Chrome trace event format.
+        """
+        with self._lock: events = list(self._events); origin = self._origin
+        pid = os.getpid(); trace = []
+        for thread_id, thread_name in list(self._thread_names.items()): trace.append({"name": "thread_name", "ph": "M", "pid": pid, "tid": thread_id, "args": {"name": thread_name}})
+        for event in events:
+            if event[0] == 'X': _, name, start, duration, thread_id, args = event; trace.append({"name": name, "ph": "X", "ts": (start - origin) / 1000, "dur": duration / 1000, "pid": pid, "tid": thread_id, "args": args})
+            else: _, name, now, value, thread_id = event; trace.append({"name": name, "ph": "C", "ts": (now - origin) / 1000, "pid": pid, "tid": thread_id, "args": {name: value}})
+        with open(path, "w", encoding="utf-8") as f: json.dump({"traceEvents": trace, "displayTimeUnit": "ms"}, f)
+
+profiler = Profiler()
+
+# --- Token Counting ---
+class CharEstimateTokenizer:
+    """
+    The classic ~4 characters per token estimate, used when no vocabulary file is configured.
+    """
+    name = "estimate"; exact = False
+    def count(self, text): return len(text) / 4
+
+# Pre-tokenization patterns of the tiktoken encodings: the original (needs the `regex` package for \p{..})
+# and a stdlib `re` translation that gives identical splits for ASCII text.
+_LETTER, _NOT_LETTER_DIGIT = r"[^\W\d_]", r"(?:[^\r\n\w]|_)"
+_BPE_PATTERNS = {
+    "r50k": (r"""'s|'t|'re|'ve|'m|'ll|'d| ?\p{L}+| ?\p{N}+| ?[^\s\p{L}\p{N}]+|\s+(?!\S)|\s+""",
+             rf"""'s|'t|'re|'ve|'m|'ll|'d| ?{_LETTER}+| ?\d+| ?(?:[^\s\w]|_)+|\s+(?!\S)|\s+"""),
+    "cl100k": (r"""(?i:'s|'t|'re|'ve|'m|'ll|'d)|[^\r\n\p{L}\p{N}]?\p{L}+|\p{N}{1,3}| ?[^\s\p{L}\p{N}]+[\r\n]*|\s*[\r\n]+|\s+(?!\S)|\s+""",
+               rf"""(?i:'s|'t|'re|'ve|'m|'ll|'d)|{_NOT_LETTER_DIGIT}?{_LETTER}+|\d{{1,3}}| ?(?:[^\s\w]|_)+[\r\n]*|\s*[\r\n]+|\s+(?!\S)|\s+"""),
+    "o200k": (r"""[^\r\n\p{L}\p{N}]?[\p{Lu}\p{Lt}\p{Lm}\p{Lo}\p{M}]*[\p{Ll}\p{Lm}\p{Lo}\p{M}]+(?i:'s|'t|'re|'ve|'m|'ll|'d)?|[^\r\n\p{L}\p{N}]?[\p{Lu}\p{Lt}\p{Lm}\p{Lo}\p{M}]+[\p{Ll}\p{Lm}\p{Lo}\p{M}]*(?i:'s|'t|'re|'ve|'m|'ll|'d)?|\p{N}{1,3}| ?[^\s\p{L}\p{N}]+[\r\n/]*|\s*[\r\n]+|\s+(?!\S)|\s+""",
+              rf"""{_NOT_LETTER_DIGIT}?[^\W\d_a-z]*[^\W\d_A-Z]+(?i:'s|'t|'re|'ve|'m|'ll|'d)?|{_NOT_LETTER_DIGIT}?[^\W\d_a-z]+[^\W\d_A-Z]*(?i:'s|'t|'re|'ve|'m|'ll|'d)?|\d{{1,3}}| ?(?:[^\s\w]|_)+[\r\n/]*|\s*[\r\n]+|\s+(?!\S)|\s+"""),
+}
+_BPE_PATTERNS["p50k"] = _BPE_PATTERNS["r50k"]
+
+class BPETokenizer:
+    """
+    Exact byte-pair-encoding token counts from a local tiktoken-format vocabulary file ("<base64 token> <rank>"
+    per line, e.g. cl100k_base.tiktoken). The split pattern follows the file name (r50k/p50k/cl100k/o200k,
+    cl100k if none matches). Uses the `tiktoken` package when installed, otherwise a pure Python merge loop
+    with a memo of already counted pieces. Without `tiktoken` or `regex`, the stdlib `re` split only matches
+    tiktoken for ASCII text, so the counts are marked as not exact. Never touches the network.
+    """
+    exact = True
+    MAX_MEMO = 200000
+    def __init__(self, vocab_file):
+        self.name = os.path.basename(vocab_file).split('.')[0]
+        self.ranks = {}
+        with open(vocab_file, "rb") as f:
+            for line in f:
+                token, _, rank = line.partition(b" ")
+                if rank.strip(): self.ranks[base64.b64decode(token)] = int(rank)
+        if not self.ranks: raise ValueError(f"no tokens in {vocab_file}")
+        kind = next((kind for kind in _BPE_PATTERNS if kind in self.name), "cl100k")
+        pattern, stdlib_pattern = _BPE_PATTERNS[kind]
+        self._memo = {}; self._encoding = None
+        try:
+            import tiktoken
+            self._encoding = tiktoken.Encoding(self.name, pat_str=pattern, mergeable_ranks=self.ranks, special_tokens={})
+            return
+        except ImportError: pass
+        try:
+            import regex
+            self._split = regex.compile(pattern).findall
+        except ImportError: self._split = re.compile(stdlib_pattern).findall; self.exact = False
+
+    def count(self, text):
+        if self._encoding is not None: return len(self._encoding.encode_ordinary(text))
+        memo = self._memo
+        if len(memo) > self.MAX_MEMO: memo.clear()
+        total = 0
+        for piece in self._split(text):
+            tokens = memo.get(piece)
+            if tokens is None: tokens = memo[piece] = self._count_piece(piece.encode("utf-8", errors="surrogatepass"))
+            total += tokens
+        return total
+
+    def _count_piece(self, piece):
+        """
+        Merges the lowest-ranked adjacent pair until none is in the vocabulary, as tiktoken does.
+        """
+        ranks = self.ranks
+        if piece in ranks: return 1
+        parts = [piece[i:i + 1] for i in range(len(piece))]
+        while len(parts) > 1:
+            best_rank = None; best_at = 0
+            for i in range(len(parts) - 1):
+                rank = ranks.get(parts[i] + parts[i + 1])
+                if rank is not None and (best_rank is None or rank < best_rank): best_rank = rank; best_at = i
+            if best_rank is None: break
+            parts[best_at:best_at + 2] = [parts[best_at] + parts[best_at + 1]]
+        return len(parts)
+
+def load_tokenizer(settings):
+    """
+    Returns the tokenizer for the "tokenizer_vocab_file" setting, or the character estimate if none is set
+    or the file cannot be loaded.
+    """
+    vocab_file = settings.get("tokenizer_vocab_file")
+    if not vocab_file: return CharEstimateTokenizer()
+    try: return BPETokenizer(os.path.expanduser(vocab_file))
+    except (OSError, ValueError) as e:
+        print(f"Tokenizer Error: Could not load vocabulary '{vocab_file}': {e}")
+        return CharEstimateTokenizer()
+
+class TokenCounter:
+    """
+    Per-file token counts memoized by content hash. A file is re-hashed only when its mtime or size changed and
+    re-tokenized only when its content was not seen before, so renames and copies are free. With `skeleton`,
+    the count is for the file's Python skeleton. Files are read as read_source_text would write them under
+    `settings`, so binaries and oversized files are never loaded whole. Thread-safe; `submit` counts on a
+    small background pool.
+    """
+    def __init__(self, tokenizer, max_workers=4, max_entries=50000, settings=None):
+        self.tokenizer = tokenizer; self.max_entries = max_entries; self.settings = settings if settings is not None else {}
+        self._digests = OrderedDict()  # path -> ((mtime_ns, size), content digest)
+        self._counts = OrderedDict()   # (content digest, skeleton) -> tokens
+        self._lock = threading.Lock()
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="token-count")
+
+    def count_file(self, file_path, skeleton=False):
+        return self.measure(file_path, skeleton)[0]
+
+    @profiler.timed("count_tokens")
+    def measure(self, file_path, skeleton=False):
+        """
+        Returns (tokens, content digest, size) for a file; the digest is None if the file cannot be read.
+        """
+        try: stat = os.stat(file_path)
+        except OSError: self.invalidate(file_path); return 0, None, 0
+        key = (stat.st_mtime_ns, stat.st_size)
+        max_bytes = oversized_limit(self.settings)
+        if max_bytes and stat.st_size > max_bytes:
+            # Only the head and tail (or nothing) are read, so there is no content digest to memoize by
+            return self.tokenizer.count(read_source_text(file_path, self.settings)[0]), None, stat.st_size
+        with self._lock:
+            entry = self._digests.get(file_path)
+            tokens = self._counts.get((entry[1], skeleton)) if entry is not None and entry[0] == key else None
+            if tokens is not None:
+                self._digests.move_to_end(file_path); self._counts.move_to_end((entry[1], skeleton))
+                return tokens, entry[1], stat.st_size
+        try:
+            with open(file_path, "rb") as f: data = f.read()
+        except OSError: return 0, None, 0
+        profiler.count("files_read"); profiler.count("bytes_read", len(data))
+        digest = hashlib.blake2b(data, digest_size=16).digest()
+        with self._lock: tokens = self._counts.get((digest, skeleton))
+        if tokens is None:
+            profiler.count("bytes_tokenized", len(data))
+            if self.settings.get("skip_binary_files") and looks_binary(data[:SNIFF_BYTES]): tokens = self.tokenizer.count(f"*Binary file ({len(data):,} bytes), not included.*")
+            else:
+                text = _decode_source(data)
+                tokens = self.tokenizer.count(skeleton_cache.skeleton(text) if skeleton else text)
+        with self._lock:
+            self._remember_digest(file_path, key, digest)
+            self._counts[(digest, skeleton)] = tokens; self._counts.move_to_end((digest, skeleton))
+            while len(self._counts) > self.max_entries: self._counts.popitem(last=False)
+        return tokens, digest, stat.st_size
+
+    def file_digest(self, file_path):
+        """
+        Returns the content digest of a file, re-reading it only if it changed since it was last counted.
+        """
+        try: stat = os.stat(file_path)
+        except OSError: return None
+        key = (stat.st_mtime_ns, stat.st_size)
+        with self._lock:
+            entry = self._digests.get(file_path)
+            if entry is not None and entry[0] == key: return entry[1]
+        digest = file_digest(file_path)
+        if digest is not None:
+            with self._lock: self._remember_digest(file_path, key, digest)
+        return digest
+
+    def _remember_digest(self, file_path, key, digest):
+        self._digests[file_path] = (key, digest); self._digests.move_to_end(file_path)
+        while len(self._digests) > self.max_entries: self._digests.popitem(last=False)
+
+    def count_text(self, text): return self.tokenizer.count(text)
+
+    def submit(self, file_path, skeleton=False):
+        """
+        Measures `file_path` on the pool; returns a concurrent.futures.Future with (tokens, content digest, size).
+        """
+        return self._pool.submit(self.measure, file_path, skeleton)
+
+    def invalidate(self, file_path):
+        with self._lock: self._digests.pop(file_path, None)
+
+    def clear(self):
+        with self._lock: self._digests.clear(); self._counts.clear()
+
+    def shutdown(self): self._pool.shutdown(wait=False, cancel_futures=True)
+
+def file_digest(file_path):
+    """
+    Returns the blake2b content digest TokenCounter uses, or None if the file cannot be read.
+    """
+    digest = hashlib.blake2b(digest_size=16)
+    try:
+        with open(file_path, "rb") as f:
+            for chunk in iter(lambda: f.read(1 << 20), b""): digest.update(chunk)
+    except OSError: return None
+    return digest.digest()
+
+def _head_digest(file_path, size):
+    """
+    Digest of the first `size` bytes of a file, or None if it cannot be read.
+    """
+    try:
+        with open(file_path, "rb") as f: return hashlib.blake2b(f.read(size), digest_size=16).digest()
+    except OSError: return None
+
+MIN_DEDUP_SIZE = 64
+DEDUP_HEAD_SIZE = 8 * 1024
+
+@profiler.timed("find_duplicates")
+def find_duplicate_files(file_paths, token_counter=None, variants=None, min_size=MIN_DEDUP_SIZE, max_size=None):
+    """
+    Maps each file whose content repeats an earlier file in `file_paths` to that first file. Only files that share
+    a size with another one are hashed (through `token_counter`'s cached digests when given; without them, larger
+    files are read in full only when their first DEDUP_HEAD_SIZE bytes match another one's); files smaller than
+    `min_size` are left alone, since a reference would not be shorter, and so are files over `max_size`, which are
+    never read in full. `variants` (path -> value) keeps files apart that are written differently, such as
+    skeletons and full sources.
+    """
+    by_size = {}
+    for path in file_paths:
+        try: size = os.path.getsize(path)
+        except OSError: continue
+        if size >= min_size and (not max_size or size <= max_size): by_size.setdefault(size, []).append(path)
+    first_by_content = {}; duplicates = {}
+    for size, group in by_size.items():
+        if len(group) < 2: continue
+        if token_counter is None and size > DEDUP_HEAD_SIZE:
+            by_head = {}
+            for path in group: by_head.setdefault(_head_digest(path, DEDUP_HEAD_SIZE), []).append(path)
+            group = [path for head, paths in by_head.items() if head is not None and len(paths) > 1 for path in paths]
+        for path in group:
+            digest = token_counter.file_digest(path) if token_counter else file_digest(path)
+            if digest is None: continue
+            first = first_by_content.setdefault((digest, variants.get(path) if variants else None), path)
+            if first != path: duplicates[path] = first
+    return duplicates
+
+# --- Exclusion Patterns ---
+def _glob_to_regex(pattern):
+    """
+    Translates one gitignore-style glob into a regex: `*`/`?`/`[...]` never cross a '/', `**` spans folders.
+    """
+    regex = []; i = 0; n = len(pattern)
+    while i < n:
+        c = pattern[i]
+        if pattern.startswith('**/', i) and (i == 0 or pattern[i - 1] == '/'): regex.append('(?:.*/)?'); i += 3; continue
+        if pattern.startswith('**', i) and i + 2 == n and (i == 0 or pattern[i - 1] == '/'): regex.append('.*'); i += 2; continue
+        if c == '*': regex.append('[^/]*')
+        elif c == '?': regex.append('[^/]')
+        elif c == '\\' and i + 1 < n: i += 1; regex.append(re.escape(pattern[i]))
+        elif c == '[':
+            end = pattern.find(']', i + 2 if pattern[i + 1:i + 2] in ('!', '^') else i + 1)
+            if end < 0: regex.append(re.escape(c))
+            else:
+                body = pattern[i + 1:end]
+                if body[:1] in ('!', '^'): body = '^' + body[1:]
+                regex.append('[' + body.replace('\\', '\\\\') + ']'); i = end
+        else: regex.append(re.escape(c))
+        i += 1
+    return ''.join(regex)
+
+class IgnorePatterns:
+    """
+    One compiled list of gitignore-style patterns, relative to the project folder `base`.
+    Patterns without a '/' match a name at any depth (like the old exact-name exclusions); patterns with one
+    are anchored to `base`. A trailing '/' restricts a pattern to folders and a leading '!' re-includes.
+    """
+    def __init__(self, lines, base='.'):
+        self.base_prefix = '' if base == '.' else base + '/'
+        parsed = []
+        for line in lines:
+            line = line.rstrip('\n\r')
+            if line.endswith(' ') and not line.endswith('\\ '): line = line.rstrip(' ')
+            if not line or line.startswith('#'): continue
+            negate = line.startswith('!')
+            if negate: line = line[1:]
+            elif line.startswith('\\!') or line.startswith('\\#'): line = line[1:]
+            dir_only = line.endswith('/')
+            line = line.rstrip('/')
+            if not line: continue
+            anchored = '/' in line
+            parsed.append((line.lstrip('/'), negate, dir_only, anchored))
+        self.has_negations = any(negate for _, negate, _, _ in parsed)
+        # Without negations the order of patterns does not matter: plain names go into a set and the globs are
+        # folded into one regex per kind, so checking an entry is a set lookup plus at most a few regex matches.
+        self.names = set(); self.dir_names = set(); self.rules = []
+        for pattern, negate, dir_only, anchored in parsed:
+            if not self.has_negations and not anchored and not any(c in pattern for c in '*?[\\'):
+                (self.dir_names if dir_only else self.names).add(pattern)
+            else:
+                self.rules.append((re.compile(_glob_to_regex(pattern) + r'\Z'), negate, dir_only, anchored))
+        self._combined = {}
+        if not self.has_negations:
+            for anchored in (False, True):
+                for dir_only in (False, True):
+                    parts = [rule[0].pattern for rule in self.rules if rule[3] == anchored and rule[2] == dir_only]
+                    if parts: self._combined[(anchored, dir_only)] = re.compile('|'.join(f'(?:{part})' for part in parts)).match
+
+    def __bool__(self):
+        return bool(self.names or self.dir_names or self.rules)
+
+    def match(self, rel_path, name, is_dir):
+        """
+        Returns True if the entry is excluded, False if a negation re-includes it, or None if no pattern applies.
+        """
+        if name in self.names or (is_dir and name in self.dir_names): return True
+        if not self.rules: return None
+        local_path = rel_path[len(self.base_prefix):]
+        if not self.has_negations:
+            for (anchored, dir_only), match in self._combined.items():
+                if (is_dir or not dir_only) and match(local_path if anchored else name): return True
+            return None
+        for regex, negate, dir_only, anchored in reversed(self.rules):
+            if dir_only and not is_dir: continue
+            if regex.match(local_path if anchored else name): return not negate
+        return None
+
+class ExclusionMatcher:
+    """
+    The exclusion settings plus the .gitignore files found on the way down to a folder. The deepest .gitignore
+    with a matching pattern decides, as in git; the settings' exclude list always excludes.
+    """
+    def __init__(self, settings, global_patterns=None, chain=()):
+        self.settings = settings; self.exclude_dotfiles = settings.get("exclude_dotfiles"); self.use_gitignore = settings.get("use_gitignore")
+        self.global_patterns = global_patterns if global_patterns is not None else IgnorePatterns(settings.get("exclude_list") or [])
+        self.chain = chain
+
+    def for_child(self, current_path, current_rel_path, names):
+        """
+        Returns the matcher for the entries of a folder, adding its .gitignore (and, at the root, .git/info/exclude).
+        """
+        if not self.use_gitignore: return self
+        sources = []
+        if current_rel_path == '.': sources.append(os.path.join(current_path, '.git', 'info', 'exclude'))
+        if '.gitignore' in names: sources.append(os.path.join(current_path, '.gitignore'))
+        chain = self.chain
+        for source in sources:
+            try:
+                with open(source, 'r', encoding='utf-8', errors='replace') as f: patterns = IgnorePatterns(f.readlines(), current_rel_path)
+            except OSError: continue
+            if patterns: chain = chain + (patterns,)
+        return self if chain is self.chain else ExclusionMatcher(self.settings, self.global_patterns, chain)
+
+    def is_excluded(self, rel_path, name, is_dir):
+        if self.exclude_dotfiles and name.startswith('.'): return True
+        if self.global_patterns.match(rel_path, name, is_dir): return True
+        for patterns in reversed(self.chain):
+            result = patterns.match(rel_path, name, is_dir)
+            if result is not None: return result
+        return False
+
+    @classmethod
+    def for_directory(cls, project_path, rel_path, settings):
+        """
+        Builds the matcher for the entries of `rel_path` by reading the .gitignore files from the root down.
+        """
+        matcher = cls(settings)
+        folders = ['.'] + ([] if rel_path == '.' else ['/'.join(rel_path.split('/')[:depth]) for depth in range(1, rel_path.count('/') + 2)])
+        for folder in folders:
+            folder_path = project_path if folder == '.' else os.path.join(project_path, folder.replace('/', os.sep))
+            matcher = matcher.for_child(folder_path, folder, ('.gitignore',) if os.path.isfile(os.path.join(folder_path, '.gitignore')) else ())
+        return matcher
+
+# --- Background File Scanning ---
+class ProjectScanner:
+    """
+    Walks a project with os.scandir on a thread pool and hands the entries to `on_batch` in batches.
+    A folder's entries are always delivered before anything found inside its subfolders.
+    """
+    BATCH_SIZE = 2000
+    BATCH_INTERVAL = 0.05
+    def __init__(self, path, settings, on_batch, max_workers=None, scan_index=None):
+        self.project_path = path; self.settings = settings; self.on_batch = on_batch; self.is_running = True
+        self.max_workers = max_workers or min(32, (os.cpu_count() or 1) * 4); self.scan_index = scan_index
+        self._pending = []; self._pending_lock = threading.RLock(); self._last_flush = 0.0
+        self.matcher = ExclusionMatcher(settings)
+    @profiler.timed("scan")
+    def run(self):
+        """
+        Scans the whole project. Returns False if the scan was stopped before it completed.
+        With "use_git_index" set, a git checkout is listed from its index instead of being walked; a folder
+        without tracked files is walked as usual.
+        """
+        listings = git_listings(self.project_path, self.settings)
+        if listings is not None: return self._run_from_listings(listings)
+        if self.scan_index: self.scan_index.load()
+        with ThreadPoolExecutor(max_workers=self.max_workers) as pool:
+            futures = {pool.submit(self._scan_directory, self.project_path, '.', self.matcher)}
+            while futures and self.is_running:
+                done, futures = wait(futures, return_when=FIRST_COMPLETED)
+                for future in done:
+                    for full_path, rel_path, matcher in future.result():
+                        futures.add(pool.submit(self._scan_directory, full_path, rel_path, matcher))
+            for future in futures: future.cancel()
+        if self.is_running:
+            self._flush(force=True)
+            if self.scan_index: self.scan_index.save()
+        return self.is_running
+    def _run_from_listings(self, listings):
+        """
+        Delivers ready-made per-folder listings breadth-first. Tracked files are not subject to .gitignore,
+        so only the settings' exclusions apply.
+        """
+        folders = deque(['.'])
+        while folders and self.is_running:
+            current_rel_path = folders.popleft()
+            current_path = self.project_path if current_rel_path == '.' else os.path.join(self.project_path, current_rel_path.replace('/', os.sep))
+            items = filter_listing(listings.get(current_rel_path, []), current_path, current_rel_path, self.settings, self.matcher)
+            if items: self._queue_items(items)
+            folders.extend(item['rel_path'] for item in items if item['is_dir'])
+        if self.is_running: self._flush(force=True)
+        return self.is_running
+    def _scan_directory(self, current_path, current_rel_path, matcher):
+        """
+        Lists one directory, queues its entries and returns the subdirectories to descend into.
+        Excluded folders are dropped here, so their contents are never listed.
+        """
+        if not self.is_running: return []
+        try: listing = self._list_directory(current_path, current_rel_path)
+        except OSError as e: print(f"Skipping inaccessible path: {e}"); return []
+        profiler.count("folders_listed")
+        matcher = matcher.for_child(current_path, current_rel_path, [name for name, is_dir in listing if not is_dir and name == '.gitignore'])
+        items = filter_listing(listing, current_path, current_rel_path, self.settings, matcher)
+        if items: self._queue_items(items)
+        return [(item['full_path'], item['rel_path'], matcher) for item in items if item['is_dir']]
+    def _list_directory(self, current_path, current_rel_path):
+        """
+        Returns the sorted (name, is_dir) entries of a directory. With a scan index, a directory whose mtime is
+        unchanged is served from the index without being listed again.
+        """
+        if self.scan_index is None:
+            with os.scandir(current_path) as it: return [(entry.name, is_dir) for entry, is_dir in _entry_types(sorted(it, key=lambda entry: entry.name))]
+        mtime_ns = os.stat(current_path).st_mtime_ns
+        listing = self.scan_index.lookup(current_rel_path, mtime_ns)
+        if listing is None:
+            with os.scandir(current_path) as it: listing = [(entry.name, is_dir) for entry, is_dir in _entry_types(sorted(it, key=lambda entry: entry.name))]
+            self.scan_index.record(current_rel_path, mtime_ns, listing)
+        return listing
+    def _queue_items(self, items):
+        with self._pending_lock:
+            self._pending.extend(items)
+            self._flush()
+    def _flush(self, force=False):
+        """
+        Delivers the pending entries once enough have accumulated or the batch interval has passed.
+        """
+        with self._pending_lock:
+            now = time.monotonic()
+            if not self._pending or not (force or len(self._pending) >= self.BATCH_SIZE or now - self._last_flush >= self.BATCH_INTERVAL): return
+            batch, self._pending, self._last_flush = self._pending, [], now
+            profiler.count("items_scanned", len(batch))
+            self.on_batch(batch)
+    def stop(self): self.is_running = False
+
+def filter_listing(listing, current_path, current_rel_path, settings, matcher=None):
+    """
+    Turns a directory's (name, is_dir) listing into item records, applying the exclusion patterns
+    (`matcher`, built from the settings if not given) and the extension map.
+    """
+    matcher = matcher or ExclusionMatcher(settings); is_excluded = matcher.is_excluded; extension_map = settings.get("extension_map")
+    prefix = '' if current_rel_path == '.' else current_rel_path + '/'; base = os.path.join(current_path, '')
+    items = []; append = items.append
+    for name, is_dir in listing:
+        if not is_dir:
+            # Same result as os.path.splitext (leading dots do not start an extension), without the call overhead
+            dot = name.rfind('.')
+            if (name[dot:].lower() if dot > 0 and (name[0] != '.' or name[:dot].lstrip('.')) else '') not in extension_map: continue
+        rel_path = prefix + name
+        if is_excluded(rel_path, name, is_dir): continue
+        append({'name': name, 'full_path': base + name, 'rel_path': rel_path, 'parent_rel_path': current_rel_path, 'is_dir': is_dir})
+    return items
+
+# --- Path Search Index ---
+class PathIndex:
+    """
+    Case-insensitive substring search over project-relative paths, filled in as entries are scanned. The paths are
+    searched as one lowercased, newline-joined string: str.find jumps from match to match and a bisect over the path
+    offsets turns a position into an id, so a selective query never touches the other paths in Python. Typing more
+    characters only re-checks the previous matches. Ids are stable; removed paths simply never match again.
+    """
+    def __init__(self): self.clear()
+    def clear(self):
+        self._lower = []; self._text = None; self._offsets = None; self._last_query = None; self._last_ids = None
+    def __len__(self): return len(self._lower)
+    def add(self, rel_path):
+        """
+        Adds a path and returns its id.
+        """
+        self._lower.append(rel_path.lower()); self._text = None; self._last_query = None
+        return len(self._lower) - 1
+    def remove(self, path_id):
+        self._lower[path_id] = ""; self._text = None; self._last_query = None
+    def _build(self):
+        lower = self._lower
+        self._text = "\n".join(lower)
+        # Start offset of every path (plus one past the end): running sum of the lengths and newlines, all in C
+        self._offsets = list(itertools.accumulate(map(operator.add, map(len, lower), itertools.repeat(1)), initial=0))
+    def search(self, query):
+        """
+        Returns the ids (ascending) of the paths containing `query`.
+        """
+        query = query.lower()
+        if not query or "\n" in query: return []
+        lower = self._lower
+        if self._last_query is not None and self._last_query in query: ids = [i for i in self._last_ids if query in lower[i]]
+        else:
+            if self._text is None: self._build()
+            text, offsets = self._text, self._offsets; find = text.find
+            ids = []; pos = find(query); common = len(lower) // 32
+            while pos != -1:
+                path_id = bisect_right(offsets, pos) - 1; ids.append(path_id)
+                if len(ids) > common:
+                    # A query matching a large share of the paths is cheaper as one pass over the rest
+                    ids.extend(i for i in range(path_id + 1, len(lower)) if query in lower[i]); break
+                pos = find(query, offsets[path_id + 1])
+        self._last_query = query; self._last_ids = ids
+        return ids
+
+def list_directory_items(project_path, current_rel_path, settings, listings=None):
+    """
+    Lists a single project folder (no recursion) and returns its filtered item records.
+    With `listings` from git_listings, the folder's tracked entries are used instead of its contents.
+    """
+    current_path = project_path if current_rel_path == '.' else os.path.join(project_path, current_rel_path.replace('/', os.sep))
+    if listings is not None: return filter_listing(listings.get(current_rel_path, []), current_path, current_rel_path, settings)
+    with os.scandir(current_path) as it: listing = [(entry.name, is_dir) for entry, is_dir in _entry_types(sorted(it, key=lambda entry: entry.name))]
+    matcher = ExclusionMatcher.for_directory(project_path, current_rel_path, settings)
+    return filter_listing(listing, current_path, current_rel_path, settings, matcher)
+
+def _entry_types(entries):
+    """
+    Pairs DirEntry objects with their cached is_dir() result, skipping entries that vanished mid-scan.
+    """
+    for entry in entries:
+        try: yield entry, entry.is_dir()
+        except OSError: continue
+
+def scan_project(path, settings, scan_index=None):
+    """
+    Scans `path` synchronously and returns all item records (parents before their children).
+    """
+    results = []
+    ProjectScanner(path, settings, results.extend, scan_index=scan_index).run()
+    return results
+
+# --- Persistent Scan Index ---
+def project_key(project_path):
+    """
+    Short stable file name stem for a project's entries in the config folder.
+    """
+    return hashlib.sha1(os.path.normcase(os.path.abspath(project_path)).encode("utf-8")).hexdigest()[:20]
+
+def write_file_atomic(path, data):
+    """
+    Writes bytes to a temporary file next to `path` and moves it into place, so readers never see a partial file.
+    """
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    # Unique per process and thread: batch jobs running in parallel may save the same file
+    temp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(temp_path, "wb") as f: f.write(data)
+    os.replace(temp_path, path)
+
+@contextlib.contextmanager
+def file_lock(path):
+    """
+    Holds an exclusive lock on the file at `path` (created if needed), shared across processes, e.g. by batch
+    jobs that update the same config file.
+    """
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "a+b") as f:
+        if sys.platform == 'win32':
+            import msvcrt
+            while True:
+                f.seek(0)
+                try: msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1); break
+                except OSError: pass  # LK_LOCK gives up after about 10 seconds; keep waiting
+            try: yield
+            finally: f.seek(0); msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+        else:
+            import fcntl
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+            try: yield
+            finally: fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+
+class ScanIndex:
+    """
+    Per-project record of every scanned directory's mtime and unfiltered listing (name, is_dir).
+    Stored as a small magic header followed by zlib-compressed JSON; files with another version are ignored.
+    """
+    MAGIC = b"SHERPA-SCAN-INDEX"
+    VERSION = 2
+    def __init__(self, index_path, project_path):
+        self.index_path = index_path; self.project_path = project_path
+        self._previous = {}; self._current = {}
+    @classmethod
+    def for_project(cls, project_path, config_dir):
+        return cls(os.path.join(config_dir, "scan_index", f"{project_key(project_path)}.idx"), project_path)
+    def load(self):
+        self._previous = {}; self._current = {}
+        try:
+            with open(self.index_path, "rb") as f: data = f.read()
+            if not data.startswith(self.MAGIC + b"\n"): return
+            payload = json.loads(zlib.decompress(data[len(self.MAGIC) + 1:]).decode("utf-8"))
+        except (OSError, zlib.error, ValueError): return
+        if payload.get("version") != self.VERSION or payload.get("project") != self.project_path: return
+        self._previous = payload.get("directories", {})
+    def lookup(self, rel_path, mtime_ns):
+        entry = self._previous.get(rel_path)
+        if entry is None or entry[0] != mtime_ns: return None
+        self._current[rel_path] = entry
+        return [(name, bool(is_dir)) for name, is_dir in entry[1]]
+    def record(self, rel_path, mtime_ns, listing):
+        # Dict assignment is atomic, so pool threads may call this
+        self._current[rel_path] = [mtime_ns, [[name, int(is_dir)] for name, is_dir in listing]]
+    def save(self):
+        """
+        Replaces the index with the directories seen in this scan, atomically.
+        """
+        payload = {"version": self.VERSION, "project": self.project_path, "directories": self._current}
+        data = self.MAGIC + b"\n" + zlib.compress(json.dumps(payload, separators=(',', ':')).encode("utf-8"), 6)
+        try: write_file_atomic(self.index_path, data)
+        except OSError as e: print(f"Scan Index Error: Could not save scan index: {e}")
+
+# --- Git Index Backend ---
+class GitIndex:
+    """
+    Reads the tracked paths of a git checkout straight from .git/index (versions 2 to 4), without a git binary.
+    Only stage-0 entries are kept; submodules and skip-worktree entries (including sparse-index folders) are skipped.
+    """
+    SIGNATURE = b"DIRC"
+    def __init__(self, worktree, git_dir):
+        self.worktree = worktree; self.git_dir = git_dir
+    @classmethod
+    def find(cls, project_path):
+        """
+        Returns the GitIndex of the checkout containing `project_path`, or None if there is no repository
+        (or nothing has been added to it yet). Handles worktrees and submodules, whose .git is a file
+        pointing at the real git directory.
+        """
+        folder = os.path.abspath(project_path)
+        while True:
+            dot_git = os.path.join(folder, '.git'); git_dir = None
+            if os.path.isdir(dot_git): git_dir = dot_git
+            elif os.path.isfile(dot_git):
+                try:
+                    with open(dot_git, 'r', encoding='utf-8') as f: line = f.readline().strip()
+                except OSError: return None
+                if not line.startswith('gitdir:'): return None
+                git_dir = os.path.normpath(os.path.join(folder, line[len('gitdir:'):].strip()))
+            if git_dir is not None: return cls(folder, git_dir) if os.path.isfile(os.path.join(git_dir, 'index')) else None
+            parent = os.path.dirname(folder)
+            if parent == folder: return None
+            folder = parent
+    def _hash_size(self):
+        # SHA-256 repositories declare it in .git/config (or the common dir's config for worktrees)
+        config_dirs = [self.git_dir]
+        try:
+            with open(os.path.join(self.git_dir, 'commondir'), 'r', encoding='utf-8') as f: config_dirs.append(os.path.join(self.git_dir, f.read().strip()))
+        except OSError: pass
+        for config_dir in config_dirs:
+            try:
+                with open(os.path.join(config_dir, 'config'), 'r', encoding='utf-8', errors='replace') as f: config = f.read()
+            except OSError: continue
+            return 32 if re.search(r'^\s*objectformat\s*=\s*sha256\s*$', config, re.MULTILINE | re.IGNORECASE) else 20
+        return 20
+    def entries(self):
+        """
+        Returns the tracked (path, size) pairs in index order, with '/'-separated paths relative to the worktree.
+        Entries marked skip-worktree are left out, as they are not checked out. Raises ValueError for an unreadable index.
+        """
+        with open(os.path.join(self.git_dir, 'index'), 'rb') as f: data = f.read()
+        if len(data) < 12 or data[:4] != self.SIGNATURE: raise ValueError("not a git index")
+        version, count = struct.unpack_from('>II', data, 4)
+        if version not in (2, 3, 4): raise ValueError(f"unsupported git index version {version}")
+        hash_size = self._hash_size(); flags_at = 40 + hash_size; find = data.find
+        entries = []; offset = 12; previous = b''
+        for _ in range(count):
+            mode, size = struct.unpack_from('>I8xI', data, offset + 24)
+            flags = (data[offset + flags_at] << 8) | data[offset + flags_at + 1]
+            extended = (data[offset + flags_at + 2] << 8) | data[offset + flags_at + 3] if version >= 3 and flags & 0x4000 else 0
+            name_at = offset + flags_at + (4 if version >= 3 and flags & 0x4000 else 2)
+            if version == 4:
+                # Path prefix compression: drop N bytes from the previous path, then append a NUL-terminated suffix
+                byte = data[name_at]; name_at += 1; strip = byte & 0x7F
+                while byte & 0x80: byte = data[name_at]; name_at += 1; strip = ((strip + 1) << 7) | (byte & 0x7F)
+                end = find(b'\0', name_at)
+                if end < 0: raise ValueError("truncated git index")
+                path = previous[:len(previous) - strip] + data[name_at:end]; previous = path; offset = end + 1
+            else:
+                end = find(b'\0', name_at)
+                if end < 0: raise ValueError("truncated git index")
+                path = data[name_at:end]; offset += (end - offset + 8) & ~7
+            if flags & 0x3000 or extended & 0x4000 or mode >> 12 == 0o16: continue  # merge-conflict stages, skip-worktree and submodules
+            entries.append((path.decode('utf-8', 'surrogateescape') + ('/' if mode >> 12 == 0o4 else ''), size))
+        return entries
+    def listings(self, project_path):
+        """
+        Groups the tracked paths under `project_path` into per-folder listings shaped like a directory scan:
+        {rel_path: [(name, is_dir), ...]} with '.' for the project folder, names sorted. Tracked files deleted from
+        the worktree are left out. Returns None when nothing tracked lies under `project_path` (e.g. an untracked
+        folder inside a checkout), so the caller can scan it instead.
+        """
+        prefix = os.path.relpath(os.path.abspath(project_path), self.worktree).replace(os.sep, '/')
+        prefix = '' if prefix == '.' else prefix + '/'
+        listings = {'.': []}; found = False
+        def add_folder(folder):
+            parent, _, name = folder.rpartition('/'); parent = parent or '.'
+            if parent not in listings: add_folder(parent)
+            listings[parent].append((name, True)); listings[folder] = []
+        for path, _ in self.entries():
+            if prefix:
+                if not path.startswith(prefix): continue
+                path = path[len(prefix):]
+            is_dir = path.endswith('/')
+            if is_dir: path = path[:-1]
+            elif not os.path.lexists(os.path.join(self.worktree, prefix + path)): continue
+            found = True; folder, _, name = path.rpartition('/'); folder = folder or '.'
+            if folder not in listings: add_folder(folder)
+            if not is_dir: listings[folder].append((name, False))
+            elif path not in listings: add_folder(path)
+        if not found: return None
+        for listing in listings.values(): listing.sort()
+        return listings
+
+def git_listings(project_path, settings):
+    """
+    Returns the git index listings of `project_path` when "use_git_index" is set and it holds tracked files,
+    or None when the folder should be walked instead.
+    """
+    if not settings.get("use_git_index"): return None
+    git_index = GitIndex.find(project_path)
+    if git_index is None: return None
+    try: return git_index.listings(project_path)
+    except (OSError, ValueError) as e: print(f"Git Index Error: {e}; scanning the folder instead"); return None
+
+def select_files(items_data, include_patterns=None, tree_state=None):
+    """
+    Returns the full paths of the scanned files whose project-relative path matches any of `include_patterns`
+    (fnmatch globs; everything when no patterns are given). With a saved `tree_state` (as the GUI stores it),
+    only the files it checks are candidates.
+    """
+    is_checked = saved_selection(tree_state) if tree_state is not None else None
+    paths = []
+    for item_data in items_data:
+        if item_data['is_dir']: continue
+        if is_checked and not is_checked(item_data['rel_path']): continue
+        if include_patterns and not any(fnmatch.fnmatchcase(item_data['rel_path'], pattern) for pattern in include_patterns): continue
+        paths.append(item_data['full_path'])
+    return paths
+
+def saved_selection(tree_state):
+    """
+    Returns a rel_path -> checked function for a saved tree state: the nearest include/exclude decision on the
+    path or its folders wins ('.' is the root). States saved by older versions list every checked path instead.
+    """
+    if "include" in tree_state:
+        decisions = {**dict.fromkeys(tree_state.get("exclude", []), False), **dict.fromkeys(tree_state["include"], True)}
+    else:
+        checked = set(tree_state.get("checked", []))
+        # A listed folder only stands for its whole subtree when none of its descendants are listed
+        listed_ancestors = {rel_path[:i] for rel_path in checked for i, char in enumerate(rel_path) if char == '/'}
+        decisions = dict.fromkeys((p for p in checked if p not in listed_ancestors), True)
+    def is_checked(rel_path):
+        while rel_path:
+            decision = decisions.get(rel_path)
+            if decision is not None: return decision
+            rel_path = rel_path.rpartition('/')[0]
+        return decisions.get('.', False)
+    return is_checked
+
+# --- Python Skeletons ---
+SKELETON_EXTENSIONS = ('.py', '.pyi')
+
+class _SkeletonTransformer(ast.NodeTransformer):
+    """
+    Reduces a module to its imports, constants, class and function signatures and docstrings.
+    Function bodies become `...`; long constant values are elided the same way.
+    """
+    MAX_VALUE_CHARS = 200
+    _KEPT = (ast.Import, ast.ImportFrom, ast.Assign, ast.AnnAssign, ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef)
+    _BLOCKS = (ast.If, ast.Try, ast.With, ast.AsyncWith) + ((ast.TryStar,) if hasattr(ast, "TryStar") else ())
+    def _body(self, body):
+        kept = [node for node in body[:1] if _is_docstring(node)]
+        kept.extend(self._kept(body))
+        return kept or [ast.Expr(ast.Constant(...))]
+    def _kept(self, body):
+        kept = []
+        for node in body:
+            if isinstance(node, self._KEPT): kept.append(self.visit(node))
+            elif isinstance(node, self._BLOCKS) and not _is_main_guard(node):
+                node = self._block(node)
+                if node is not None: kept.append(node)
+        return kept
+    def _block(self, node):
+        """
+        Reduces every branch of an if/try/with, e.g. `if TYPE_CHECKING:` imports, an `except ImportError:`
+        fallback or version-gated definitions. Returns None if no branch keeps anything.
+        """
+        handlers = getattr(node, "handlers", [])
+        for handler in handlers: handler.body = self._kept(handler.body)
+        for field in ("body", "orelse", "finalbody"):
+            if hasattr(node, field): setattr(node, field, self._kept(getattr(node, field)))
+        if not (node.body or getattr(node, "orelse", None) or getattr(node, "finalbody", None) or any(handler.body for handler in handlers)): return None
+        node.body = node.body or [ast.Pass()]
+        for handler in handlers: handler.body = handler.body or [ast.Pass()]
+        if hasattr(node, "handlers") and not node.handlers and not node.finalbody: node.finalbody = [ast.Pass()]
+        return node
+    def visit_Module(self, node): node.body = self._body(node.body); return node
+    def visit_ClassDef(self, node): node.body = self._body(node.body); return node
+    def visit_FunctionDef(self, node):
+        node.body = [stmt for stmt in node.body[:1] if _is_docstring(stmt)] + [ast.Expr(ast.Constant(...))]
+        return node
+    visit_AsyncFunctionDef = visit_FunctionDef
+    def _elide(self, node):
+        if node.value is not None and len(ast.unparse(node.value)) > self.MAX_VALUE_CHARS: node.value = ast.Constant(...)
+        return node
+    visit_Assign = visit_AnnAssign = _elide
+
+def _is_docstring(node):
+    return isinstance(node, ast.Expr) and isinstance(node.value, ast.Constant) and isinstance(node.value.value, str)
+
+def _is_main_guard(node):
+    """
+    `if __name__ == "__main__":`, which runs a script rather than defining anything.
+    """
+    test = getattr(node, "test", None)
+    return (isinstance(test, ast.Compare) and isinstance(test.left, ast.Name) and test.left.id == "__name__"
+            and len(test.comparators) == 1 and isinstance(test.comparators[0], ast.Constant) and test.comparators[0].value == "__main__")
+
+def python_skeleton(source):
+    """
+    Returns the skeleton of a Python module, or None if it does not parse.
+    """
+    try: tree = ast.parse(source)
+    except (SyntaxError, ValueError): return None
+    return ast.unparse(_SkeletonTransformer().visit(tree))
+
+def uses_skeleton(file_path, output_mode):
+    """
+    Whether `file_path` is written as a skeleton under `output_mode` ("full" or "skeleton").
+    """
+    return output_mode == "skeleton" and os.path.splitext(file_path)[1].lower() in SKELETON_EXTENSIONS
+
+class SkeletonCache:
+    """
+    Bounded LRU of skeletons keyed by the source's content hash, shared by generation and token counting.
+    """
+    def __init__(self, max_entries=20000):
+        self.max_entries = max_entries
+        self._entries = OrderedDict(); self._lock = threading.Lock()
+
+    def skeleton(self, source):
+        """
+        Returns the skeleton of `source`, or `source` itself if it is not valid Python.
+        """
+        digest = hashlib.blake2b(source.encode("utf-8", errors="surrogatepass"), digest_size=16).digest()
+        with self._lock:
+            skeleton = self._entries.get(digest)
+            if skeleton is not None: self._entries.move_to_end(digest); return skeleton
+        skeleton = python_skeleton(source)
+        if skeleton is None: skeleton = source
+        with self._lock:
+            self._entries[digest] = skeleton
+            while len(self._entries) > self.max_entries: self._entries.popitem(last=False)
+        return skeleton
+
+skeleton_cache = SkeletonCache()
+
+# --- Source File Reading ---
+SNIFF_BYTES = 8192
+NOTE_KINDS = ("binary", "skipped")
+_SUSPICIOUS_CHARS = re.compile('[\x00-\x08\x0b\x0e-\x1a\x1c-\x1f\ufffd]')
+
+def looks_binary(head):
+    """
+    Sniffs a file's first bytes: a NUL, or more than 30% control characters and invalid UTF-8, means binary.
+    """
+    if not head: return False
+    if b"\0" in head: return True
+    text = head.decode("utf-8", errors="replace")
+    # A multi-byte character cut off at the end of the sample is not evidence of anything
+    return len(_SUSPICIOUS_CHARS.findall(text, 0, max(0, len(text) - 3))) > len(text) * 3 // 10
+
+def _decode_source(data):
+    # Same result as reading in text mode: invalid UTF-8 replaced, universal newlines
+    text = data.decode("utf-8", errors="replace")
+    return text.replace("\r\n", "\n").replace("\r", "\n") if "\r" in text else text
+
+def oversized_limit(settings):
+    """
+    Returns the "max_file_kb" limit in bytes, or 0 for no limit.
+    """
+    return max(0, settings.get("max_file_kb") or 0) * 1024
+
+def truncation_window(settings):
+    """
+    Returns the (head, tail) bytes kept of an oversized file, scaled down together so they never add up to more
+    than the "max_file_kb" limit (a file over the limit then always loses something in the middle).
+    """
+    head_bytes = max(0, settings.get("truncated_head_kb") or 0) * 1024; tail_bytes = max(0, settings.get("truncated_tail_kb") or 0) * 1024
+    max_bytes = oversized_limit(settings)
+    if max_bytes and head_bytes + tail_bytes > max_bytes:
+        head_bytes = max_bytes * head_bytes // (head_bytes + tail_bytes); tail_bytes = max_bytes - head_bytes
+    return head_bytes, tail_bytes
+
+def read_source_text(file_path, settings, digests=None):
+    """
+    Returns (text, bytes_read, kind) for one file as it goes into the document:
+    "text" for the whole file (read errors are returned as text so they end up in the document),
+    "truncated" for a file over the "max_file_kb" limit, of which only the head and tail are read through mmap,
+    or "binary"/"skipped" with a short note instead of the content.
+    With a `digests` dict, the file's content_fingerprint, mtime_ns and size are stored in it, taken from the
+    bytes read here.
+    """
+    max_bytes = oversized_limit(settings); skip_binary = settings.get("skip_binary_files")
+    try:
+        with open(file_path, "rb") as f:
+            stat = os.fstat(f.fileno()); size = stat.st_size
+            if max_bytes and size > max_bytes:
+                if digests is not None: digests[file_path] = (_window_fingerprint(f, size, settings), stat.st_mtime_ns, size)
+                if settings.get("oversized_files") == "skip": return f"*Skipped: {size:,} bytes is over the {max_bytes // 1024:,} KB limit.*", 0, "skipped"
+                with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                    if skip_binary and looks_binary(mm[:SNIFF_BYTES]): return f"*Binary file ({size:,} bytes), not included.*", 0, "binary"
+                    return _truncated_text(mm, size, settings)
+            data = f.read()
+    except Exception as e: return f"Error reading file: {e}", 0, "text"
+    if digests is not None: digests[file_path] = (hashlib.blake2b(data, digest_size=16).digest(), stat.st_mtime_ns, size)
+    profiler.count("files_read"); profiler.count("bytes_read", size)
+    if skip_binary and looks_binary(data[:SNIFF_BYTES]): return f"*Binary file ({size:,} bytes), not included.*", size, "binary"
+    return _decode_source(data), size, "text"
+
+def _truncated_text(mm, size, settings):
+    """
+    The head and tail of a memory-mapped file, cut at line breaks, around a marker for the part left out.
+    """
+    head_bytes, tail_bytes = truncation_window(settings)
+    head = mm[:head_bytes]; tail = mm[max(head_bytes, size - tail_bytes):] if tail_bytes else b""
+    if len(head) == head_bytes and b"\n" in head: head = head[:head.rindex(b"\n") + 1]
+    if tail and b"\n" in tail: tail = tail[tail.index(b"\n") + 1:]
+    omitted = size - len(head) - len(tail)
+    profiler.count("files_read"); profiler.count("bytes_read", len(head) + len(tail))
+    return f"{_decode_source(head).rstrip(chr(10))}\n\n... [{omitted:,} bytes omitted] ...\n\n{_decode_source(tail)}", len(head) + len(tail), "truncated"
+
+def _window_fingerprint(f, size, settings):
+    """
+    Stands in for the content digest of a file over the size limit: its size plus the head and tail truncation
+    keeps, which is all of it that can reach the document.
+    """
+    head_bytes, tail_bytes = truncation_window(settings)
+    digest = hashlib.blake2b(str(size).encode("ascii"), digest_size=16, person=b"oversized")
+    f.seek(0); digest.update(f.read(head_bytes))
+    if tail_bytes: f.seek(max(head_bytes, size - tail_bytes)); digest.update(f.read(tail_bytes))
+    return digest.digest()
+
+def content_fingerprint(file_path, settings, token_counter=None):
+    """
+    The digest document snapshots record: the content digest TokenCounter uses, or for a file over the
+    "max_file_kb" limit a fingerprint of its size, head and tail, so an oversized file is never read in full.
+    Returns None if the file cannot be read.
+    """
+    max_bytes = oversized_limit(settings)
+    try:
+        if max_bytes and os.path.getsize(file_path) > max_bytes:
+            with open(file_path, "rb") as f: return _window_fingerprint(f, os.fstat(f.fileno()).st_size, settings)
+    except OSError: return None
+    return token_counter.file_digest(file_path) if token_counter else file_digest(file_path)
+
+# --- Markdown Generation ---
+KNOWN_DEPENDENCY_FILES = ['requirements.txt', 'package.json', 'Pipfile', 'pyproject.toml', 'pom.xml', 'build.gradle']
+
+class GenerationCancelled(Exception):
+    pass
+
+def generate_tree_structure(file_paths):
+    tree = {}; lines = ["."]; P_C, P_S = "├── ", "│   "; E_C, E_S = "└── ", "    "
+    for path in file_paths:
+        parts = path.replace(os.sep, '/').split('/')
+        current_level = tree
+        for part in parts:
+            if part not in current_level: current_level[part] = {}
+            current_level = current_level[part]
+    def _build_lines(d, prefix=""):
+        items = sorted(d.keys())
+        for i, item in enumerate(items):
+            is_last = i == len(items) - 1; connector = E_C if is_last else P_C; lines.append(f"{prefix}{connector}{item}{'/' if d[item] else ''}")
+            if d[item]: _build_lines(d[item], prefix + (E_S if is_last else P_S))
+    _build_lines(tree); return "\n".join(lines)
+
+def read_files_ahead(file_paths, settings=None, max_workers=8, read_ahead=32, digests=None):
+    """
+    Yields (path, text, size, kind) in the given order while a thread pool reads up to `read_ahead` files ahead
+    (see read_source_text, which also fills `digests`).
+    """
+    paths = iter(file_paths); pending = deque(); settings = settings or {}
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        try:
+            for path in paths:
+                pending.append((path, pool.submit(read_source_text, path, settings, digests)))
+                if len(pending) >= read_ahead: break
+            while pending:
+                path, future = pending.popleft()
+                next_path = next(paths, None)
+                if next_path is not None: pending.append((next_path, pool.submit(read_source_text, next_path, settings, digests)))
+                text, size, kind = future.result()
+                yield path, text, size, kind
+        finally:
+            for _, future in pending: future.cancel()
+
+def plan_parts(costs, budget):
+    """
+    Splits the per-file `costs` (kept in order) into the fewest contiguous parts that stay within `budget`,
+    then evens the parts out by lowering the per-part limit as far as that part count allows.
+    A single file over the budget gets a part of its own. Returns a list of (start, end) index ranges.
+    """
+    def _split(limit):
+        ranges = []; start = 0; load = 0
+        for i, cost in enumerate(costs):
+            if i > start and load + cost > limit: ranges.append((start, i)); start = i; load = 0
+            load += cost
+        if costs: ranges.append((start, len(costs)))
+        return ranges
+    ranges = _split(budget)
+    if len(ranges) <= 1: return ranges
+    # Files over the budget can push the average above it; the budget itself is always a feasible limit
+    low, high = min(budget, max(1, -(-sum(costs) // len(ranges)))), budget
+    while low < high:
+        middle = (low + high) // 2
+        if len(_split(middle)) <= len(ranges): high = middle
+        else: low = middle + 1
+    return _split(low)
+
+def part_file_name(output_file, part_number):
+    stem, ext = os.path.splitext(output_file)
+    return f"{stem}_part{part_number:02d}{ext}"
+
+# The section heading every generated document (or part) has near the top, after the objective if there is one
+_DOCUMENT_HEADING = re.compile(r"^## (?:📚 Project Context|🔄 Project Changes): `[^`\n]*`(?: \(part (\d+) of \d+\))?$", re.MULTILINE)
+GENERATED_HEADING_SCAN = 256 * 1024
+
+def _is_generated_document(path, part_number=None):
+    """
+    Whether `path` holds a document this module wrote: the unsplit document when `part_number` is None, else
+    that part of a split one. Decided from its first section heading, so unrelated files are never matched.
+    """
+    try:
+        with open(path, "r", encoding="utf-8", errors="replace") as f: head = f.read(GENERATED_HEADING_SCAN)
+    except OSError: return False
+    if not head.startswith(("# 🎯 Objective\n", "## ")): return False
+    match = _DOCUMENT_HEADING.search(head)
+    if match is None: return False
+    return match.group(1) is None if part_number is None else match.group(1) is not None and int(match.group(1)) == part_number
+
+def _remove_stale_parts(output_file, part_count):
+    """
+    Deletes what an earlier run with a different part count left next to the new document: `_partNN` files
+    beyond `part_count` (all of them for a single file), and the unsplit file when writing parts. Only files
+    that carry the matching generated heading are removed.
+    """
+    stem, ext = os.path.splitext(output_file); folder = os.path.dirname(output_file) or "."
+    pattern = re.compile(re.escape(os.path.basename(stem)) + r"_part(\d{2,})" + re.escape(ext))
+    try: names = os.listdir(folder)
+    except OSError: return
+    stale = [(os.path.join(folder, name), int(match.group(1))) for name in names if (match := pattern.fullmatch(name)) and int(match.group(1)) > (part_count if part_count > 1 else 0)]
+    if part_count > 1: stale.append((output_file, None))
+    for path, part_number in stale:
+        if not _is_generated_document(path, part_number): continue
+        try: os.remove(path)
+        except OSError: pass
+
+def history_variant(output_file):
+    """
+    The ProjectStateStore variant a document's file digests are remembered under: its normalized output path.
+    """
+    return os.path.normcase(os.path.abspath(output_file))
+
+def document_snapshot(project_path, file_paths, skeletons, previous=None, token_counter=None, settings=None, read=None):
+    """
+    Records what goes into a document: {relative path: [content digest (hex), skeleton, mtime_ns, size]}. Files in
+    `read` ({path: (digest, mtime_ns, size)} filled by read_source_text) are taken from there; a file whose
+    modification time and size match its entry in `previous` keeps that digest; only the rest are read, and
+    oversized ones only in part (see content_fingerprint).
+    """
+    previous = previous or {}; read = read or {}; snapshot = {}
+    for path in file_paths:
+        rel_path = os.path.relpath(path, project_path).replace(os.sep, '/')
+        if path in read: digest, mtime_ns, size = read[path]; digest = digest.hex()
+        else:
+            try: stat = os.stat(path)
+            except OSError: continue
+            mtime_ns, size = stat.st_mtime_ns, stat.st_size; old = previous.get(rel_path)
+            if isinstance(old, list) and len(old) == 4 and old[2:] == [mtime_ns, size]: digest = old[0]
+            else:
+                digest = content_fingerprint(path, settings or {}, token_counter)
+                if digest is None: continue
+                digest = digest.hex()
+        snapshot[rel_path] = [digest, bool(skeletons.get(path)), mtime_ns, size]
+    return snapshot
+
+def diff_snapshots(previous, current, project_path=None):
+    """
+    Compares two document snapshots. Returns sorted (added, modified, removed) relative paths and the number of
+    unchanged files; a file switched between full and skeleton output counts as modified. With `project_path`,
+    only files that no longer exist count as removed, not ones that merely left the selection.
+    """
+    added = sorted(p for p in current if p not in previous)
+    removed = sorted(p for p in previous if p not in current and not (project_path and os.path.lexists(os.path.join(project_path, *p.split('/')))))
+    modified = sorted(p for p in current if p in previous and list(previous[p][:2]) != current[p][:2])
+    return added, modified, removed, len(current) - len(added) - len(modified)
+
+def _changes_manifest(changes):
+    """
+    The "Changes" section of a delta document: when the last document was made and one row per changed file.
+    """
+    counts = ", ".join(f"{len(changes[kind])} {kind}" for kind in ("added", "modified", "removed"))
+    lines = [f"Only files that changed since the document generated on {changes['since']} are included ({counts}; {changes['unchanged']} unchanged files are not repeated).\n"]
+    if any(changes[kind] for kind in ("added", "modified", "removed")):
+        lines.append("| Change | File |\n|---|---|")
+        lines.extend(f"| {kind} | `{rel_path}` |" for kind in ("added", "modified", "removed") for rel_path in changes[kind])
+    else: lines.append("*No files changed.*")
+    return "\n".join(lines) + "\n\n"
+
+@profiler.timed("generate")
+def write_markdown_document(output_file, project_path, selected_files, prompt_text, settings, progress_callback=None, is_cancelled=None, file_modes=None, token_counter=None, history=None, changes_only=False):
+    """
+    Streams the context document to `output_file`. Sections are written to a temporary file in the same folder
+    that only replaces `output_file` once complete, so a failed or cancelled run never leaves a partial document.
+    Python files are written as skeletons when their mode (`file_modes` by full path, else the "output_mode"
+    setting) is "skeleton". With the "deduplicate_files" setting, a file with the same content as an earlier one
+    is not read again; its section just points at the first copy.
+
+    With a "max_tokens_per_part" setting, a document over that size is split into balanced `<name>_partNN.md`
+    files, each repeating the header and project structure; files are never split. Sizes come from
+    `token_counter` (a TokenCounter) or, without one, from the file sizes. Returns the paths written.
+
+    `history` (a ProjectStateStore) remembers the content digests of every document's files per project and
+    output file. With `changes_only`, only files added or modified since the last document written to the same
+    output are written, after a manifest that also lists files deleted from the project; without an earlier
+    document the full document is written.
+    """
+    default_mode = settings.get("output_mode"); file_modes = file_modes or {}; changes = None; snapshot = None; read_digests = None
+    if history is not None:
+        variant = history_variant(output_file); all_files = selected_files
+        record = history.load(project_path, variant) or {}; previous = record.get("files") if isinstance(record.get("files"), dict) else {}
+        snapshot_modes = {path: uses_skeleton(path, file_modes.get(path, default_mode)) for path in selected_files}
+        if changes_only and record.get("generated"):
+            # Which files to write must be known up front, so files that changed on disk are hashed here
+            snapshot = document_snapshot(project_path, selected_files, snapshot_modes, previous, token_counter, settings)
+            added, modified, removed, unchanged = diff_snapshots(previous, snapshot, project_path)
+            changes = {"since": record["generated"], "added": added, "modified": modified, "removed": removed, "unchanged": unchanged}
+            changed = set(added) | set(modified)
+            selected_files = [p for p in selected_files if os.path.relpath(p, project_path).replace(os.sep, '/') in changed]
+    manifest = _changes_manifest(changes) if changes is not None else ""
+    has_objective = bool(prompt_text); has_structure = settings.get("show_project_structure") and selected_files
+    dependency_files = [p for p in selected_files if os.path.basename(p) in KNOWN_DEPENDENCY_FILES]
+    main_code_files = [p for p in selected_files if p not in dependency_files]
+    ordered_files = dependency_files + main_code_files; files_total = len(ordered_files); files_done = 0; bytes_read = 0
+    ext_map = settings.get("extension_map")
+    project_name = os.path.basename(os.path.normpath(project_path))
+    structure = generate_tree_structure([os.path.relpath(p, project_path) for p in selected_files]) if has_structure else ""
+    skeletons = {path: uses_skeleton(path, file_modes.get(path, default_mode)) for path in ordered_files}
+    duplicates = find_duplicate_files(ordered_files, token_counter, skeletons, max_size=oversized_limit(settings) or None) if settings.get("deduplicate_files") else {}
+    ranges = [(0, files_total)]
+    max_tokens = settings.get("max_tokens_per_part") or 0
+    if max_tokens > 0 and ordered_files:
+        # Budget for the files after the header every part repeats (the objective only goes into the first part)
+        header = f"# 🎯 Objective\n\n{prompt_text}\n\n---\n\n## 📚 Project Context: `{project_name}` (part 00 of 00)\n\n{manifest}```\n{structure}\n```\n\n"
+        header_tokens = token_counter.count_text(header) if token_counter else len(header) / 4
+        costs = [math.ceil(_section_tokens(path, project_path, skeletons[path], token_counter, settings, path in duplicates)) for path in ordered_files]
+        ranges = plan_parts(costs, max(1, max_tokens - math.ceil(header_tokens)))
+    part_count = len(ranges)
+    part_files = [output_file] if part_count == 1 else [part_file_name(output_file, number) for number in range(1, part_count + 1)]
+    temp_files = [path + ".part" for path in part_files]
+    # Without a snapshot yet, digests come from the bytes the document is written from
+    if history is not None and snapshot is None: read_digests = {}
+    reader = read_files_ahead([path for path in ordered_files if path not in duplicates], settings, digests=read_digests)
+    try:
+        for part_number, (temp_file, (start, end)) in enumerate(zip(temp_files, ranges), 1):
+            with open(temp_file, "w", encoding="utf-8") as f:
+                if has_objective and part_number == 1: f.write("# 🎯 Objective\n\n"); f.write(prompt_text); f.write("\n\n---\n\n")
+                if has_structure or start < end or (changes is not None and part_number == 1):
+                    part_label = f" (part {part_number} of {part_count})" if part_count > 1 else ""
+                    if changes is None: f.write(f"## 📚 Project Context: `{project_name}`{part_label}\n\n"); f.write("This document provides the necessary files and structure for the task.\n\n"); section_counter = 1
+                    else:
+                        f.write(f"## 🔄 Project Changes: `{project_name}`{part_label}\n\n"); section_counter = 1
+                        if part_number == 1: f.write(f"### {section_counter}. Changes\n\n"); f.write(manifest); section_counter += 1
+                    if has_structure: f.write(f"### {section_counter}. Project Structure\n\n"); f.write(f"```\n{structure}\n```\n\n"); section_counter += 1
+                    for position in range(start, end):
+                        # Duplicates, binaries and skipped files get a one-line note instead of a code block
+                        duplicate_of = duplicates.get(ordered_files[position])
+                        if duplicate_of is None: file_path, text, size, kind = next(reader)
+                        else: file_path = ordered_files[position]; size = 0; kind = "duplicate"; text = f"*Identical to `{os.path.relpath(duplicate_of, project_path).replace(os.sep, '/')}`, shown earlier.*"
+                        is_note = kind == "duplicate" or kind in NOTE_KINDS
+                        if is_cancelled and is_cancelled(): raise GenerationCancelled()
+                        filename, rel_path = os.path.basename(file_path), os.path.relpath(file_path, project_path).replace(os.sep, '/')
+                        if position < len(dependency_files):
+                            if position == start: f.write(f"### {section_counter}. Dependencies\n\n")
+                            if not is_note: f.write(f"#### `{filename}`\n*path: `{rel_path}`*\n\n```\n"); f.write(text); f.write("\n```\n\n")
+                            else: f.write(f"#### `{filename}`\n*path: `{rel_path}`*\n\n{text}\n\n")
+                            section_counter += 1
+                        else:
+                            if position == max(start, len(dependency_files)): f.write(f"### {section_counter}. File Contents\n\n")
+                            lang = ext_map.get(os.path.splitext(filename)[1].lower(), "")
+                            if is_note: f.write(f"#### 📄 `{filename}`\n\n*path: `{rel_path}`*\n\n{text}\n\n")
+                            elif skeletons[file_path] and kind == "text":
+                                f.write(f"#### 📄 `{filename}` (skeleton)\n\n*path: `{rel_path}`*\n\n```{lang}\n"); f.write(skeleton_cache.skeleton(text))
+                            else: f.write(f"#### 📄 `{filename}`\n\n*path: `{rel_path}`*\n\n```{lang}\n"); f.write(text)
+                            f.write("\n```\n\n")
+                        files_done += 1; bytes_read += size
+                        if progress_callback: progress_callback(files_done, files_total, bytes_read)
+        for temp_file, part_file in zip(temp_files, part_files): os.replace(temp_file, part_file)
+        _remove_stale_parts(output_file, part_count)
+        if history is not None and snapshot is None: snapshot = document_snapshot(project_path, all_files, snapshot_modes, previous, token_counter, settings, read_digests)
+        if history is not None: history.save(project_path, {"generated": time.strftime("%Y-%m-%d %H:%M:%S"), "output": output_file, "files": snapshot}, settings.get("max_saved_tree_states"), variant)
+    except BaseException:
+        for temp_file in temp_files:
+            try: os.remove(temp_file)
+            except OSError: pass
+        raise
+    finally: reader.close()
+    return part_files
+
+def _section_tokens(file_path, project_path, skeleton, token_counter, settings, duplicate=False):
+    """
+    Size of one file's section for planning parts: its (possibly skeleton) content plus the section heading.
+    """
+    overhead = 20 + len(os.path.relpath(file_path, project_path)) / 2
+    if duplicate: return 2 * overhead
+    if token_counter: return token_counter.count_file(file_path, skeleton) + overhead
+    try: size = os.path.getsize(file_path)
+    except OSError: return overhead
+    max_bytes = oversized_limit(settings)
+    if max_bytes and size > max_bytes:
+        if settings.get("oversized_files") == "skip": return 2 * overhead
+        size = min(size, sum(truncation_window(settings)))
+    return size / 4 + overhead
+
+# --- Settings and Config Management ---
+class SettingsManager:
+    # ... (code is identical, no changes needed) ...
+    def __init__(self, filename="settings.json"):
+        script_dir = os.path.dirname(os.path.abspath(__file__)); self.filename = os.path.join(script_dir, filename); self.settings = {}; self.load_settings()
+    def _create_default_settings(self):
+        return {"extension_map":{".py":"python",".sql":"sql",".js":"javascript",".html":"html",".css":"css",".json":"json",".md":"markdown",".txt":"text",".yml":"yaml",".yaml":"yaml",".toml":"toml",".ini":"ini",".sh":"bash",".bat":"batch",".dockerfile":"dockerfile"},"exclude_list":["__pycache__",".git",".vscode","node_modules","venv",".env"],"exclude_dotfiles":True,"show_project_structure":True,"remember_project_path":False,"restore_tree_selection":False,"use_gitignore":True,"use_git_index":False,"tokenizer_vocab_file":"","output_mode":"full","max_tokens_per_part":0,"deduplicate_files":True,"enable_profiling":False,"max_saved_tree_states":50,"changes_only":False,"skip_binary_files":True,"max_file_kb":1024,"oversized_files":"truncate","truncated_head_kb":48,"truncated_tail_kb":16,"use_scan_index":True,"watch_project_changes":True}
+    def load_settings(self):
+        try:
+            with open(self.filename,'r') as f: loaded_settings=json.load(f);defaults=self._create_default_settings();defaults.update(loaded_settings);self.settings=defaults
+        except (FileNotFoundError,json.JSONDecodeError): self.settings=self._create_default_settings();self.save_settings()
+    def save_settings(self):
+        try:
+            with open(self.filename,'w') as f:json.dump(self.settings,f,indent=4)
+        except IOError as e:print(f"Settings Error: Could not save settings: {e}")
+    def get(self,key):return self.settings.get(key)
+    def set(self,key,value):self.settings[key]=value
+def app_config_dir(organization_name="LLMSherpaOrg", application_name="LLMSherpa"):
+    """
+    Returns the same folder as QStandardPaths.AppConfigLocation without requiring Qt. The GUI's answer is used
+    when a Qt application is already running, so the GUI and the command line always share one config.
+    """
+    qt_core = sys.modules.get("PySide6.QtCore")
+    if qt_core is not None and qt_core.QCoreApplication.instance() is not None:
+        return qt_core.QStandardPaths.writableLocation(qt_core.QStandardPaths.AppConfigLocation)
+    if sys.platform == 'win32': base = os.environ.get("LOCALAPPDATA") or os.path.join(os.path.expanduser("~"), "AppData", "Local")
+    elif sys.platform == 'darwin': base = os.path.join(os.path.expanduser("~"), "Library", "Preferences")
+    else: base = os.environ.get("XDG_CONFIG_HOME") or os.path.join(os.path.expanduser("~"), ".config")
+    return os.path.join(base, organization_name, application_name)
+
+class ProjectStateStore:
+    """
+    Per-project state, one small JSON file per project in `state_dir`: tree states (check decisions, expanded
+    folders, output modes) and the record of the last generated document. A `variant` keeps several states for
+    one project apart (the document history uses the output file). Loading reads only the requested project's
+    file. Saving atomically rewrites that file and a short most-recently-saved list, and deletes the states of
+    projects beyond `max_projects` in that list.
+    """
+    VERSION = 1
+    MAX_PROJECTS = 50
+    def __init__(self, state_dir, label="Tree State"):
+        self.state_dir = state_dir; self.label = label; self.recent_path = os.path.join(state_dir, "recent.json")
+    @staticmethod
+    def _entry(project_path, variant=None): return project_path if variant is None else f"{project_path}\0{variant}"
+    def _state_path(self, entry):
+        project_path, _, variant = entry.partition("\0")
+        suffix = f"-{hashlib.sha1(variant.encode('utf-8')).hexdigest()[:12]}" if variant else ""
+        return os.path.join(self.state_dir, f"{project_key(project_path)}{suffix}.json")
+    def _read_recent(self):
+        try:
+            with open(self.recent_path, "r", encoding="utf-8") as f: return [p for p in json.load(f).get("recent", []) if isinstance(p, str)]
+        except (OSError, ValueError, AttributeError): return []
+    def load(self, project_path, variant=None):
+        """
+        Returns the saved state dict for a project, or None.
+        """
+        entry = self._entry(project_path, variant)
+        try:
+            with open(self._state_path(entry), "r", encoding="utf-8") as f: payload = json.load(f)
+        except (OSError, ValueError): return None
+        if not isinstance(payload, dict) or payload.get("version") != self.VERSION or payload.get("project") != entry: return None
+        return payload.get("state")
+    def save(self, project_path, state, max_projects=None, variant=None):
+        return self.save_many({self._entry(project_path, variant): state}, max_projects)
+    def save_many(self, states, max_projects=None):
+        """
+        Saves {project_path: state}; the first project counts as the most recently used. Returns True on success.
+        """
+        max_projects = self.MAX_PROJECTS if max_projects is None else max(1, max_projects)
+        try:
+            # The most-recent list is read, merged and rewritten under a lock so parallel savers keep each other's entries
+            with file_lock(self.recent_path + ".lock"):
+                recent = list(states) + [p for p in self._read_recent() if p not in states]
+                for entry in recent[:max_projects]:
+                    if entry in states: write_file_atomic(self._state_path(entry), json.dumps({"version": self.VERSION, "project": entry, "state": states[entry]}, separators=(',', ':')).encode("utf-8"))
+                for entry in recent[max_projects:]:
+                    try: os.remove(self._state_path(entry))
+                    except OSError: pass
+                write_file_atomic(self.recent_path, json.dumps({"version": self.VERSION, "recent": recent[:max_projects]}, indent=1).encode("utf-8"))
+            return True
+        except OSError as e: print(f"{self.label} Error: Could not save {self.label.lower()}: {e}"); return False
+
+class ConfigManager:
+    def __init__(self, app_name="LLMSherpa"):
+        self.config_dir=app_config_dir()
+        if not self.config_dir:self.config_dir=os.path.join(os.path.expanduser("~"),f".{app_name.lower()}")
+        self.config_path=os.path.join(self.config_dir,"config.json");self.config={};os.makedirs(self.config_dir,exist_ok=True)
+        self.tree_states=ProjectStateStore(os.path.join(self.config_dir,"tree_states"))
+        self.last_documents=ProjectStateStore(os.path.join(self.config_dir,"last_documents"),"Document History");self.load_config()
+    def load_config(self):
+        try:
+            with open(self.config_path,'r') as f:self.config=json.load(f)
+        except (FileNotFoundError,json.JSONDecodeError):self.config={"last_project_path":""}
+        # Older versions kept every project's tree state inside config.json; move them to the store once
+        legacy_states=self.config.get("tree_states")
+        if isinstance(legacy_states,dict) and self.tree_states.save_many(dict(reversed(list(legacy_states.items())))): del self.config["tree_states"];self.save_config()
+    def save_config(self):
+        try: write_file_atomic(self.config_path,json.dumps(self.config,indent=4).encode("utf-8"))
+        except (IOError,OSError) as e:print(f"Config Error: Could not save config: {e}")
+    def get(self,key,default=None):return self.config.get(key,default)
+    def set(self,key,value):self.config[key]=value
+
+# --- Library Entry Point ---
+def build_context_document(project_path, output_file, prompt_text="", include_patterns=None, exclude_names=None, settings=None, changes_only=False, tree_state=None):
+    """
+    Scans `project_path`, selects the matching files and writes the same context document the GUI produces.
+    A saved `tree_state` (see ConfigManager.tree_states) limits the selection to its checked files and supplies
+    per-file output modes. The files that went in are remembered in the app's config; with `changes_only`, only
+    files changed since the last document written to the same output file (from the GUI or here) are written. Returns a summary dict with the
+    output path, the part files written, file count and bytes read.
+    """
+    settings = dict(settings if settings is not None else SettingsManager().settings)
+    if exclude_names: settings["exclude_list"] = list(settings.get("exclude_list") or []) + list(exclude_names)
+    project_path = get_long_path_name(os.path.abspath(project_path))
+    scan_index = ScanIndex.for_project(project_path, app_config_dir()) if settings.get("use_scan_index") else None
+    selected_files = sorted(select_files(scan_project(project_path, settings, scan_index), include_patterns, tree_state))
+    file_modes = {os.path.join(project_path, *rel_path.split('/')): mode for rel_path, mode in (tree_state or {}).get("output_modes", {}).items()}
+    stats = {"files": 0, "bytes": 0}
+    def _progress(files_done, files_total, bytes_read): stats["files"] = files_done; stats["bytes"] = bytes_read
+    token_counter = TokenCounter(load_tokenizer(settings), max_workers=1, settings=settings) if settings.get("max_tokens_per_part") else None
+    try: output_files = write_markdown_document(output_file, project_path, selected_files, prompt_text.strip(), settings, progress_callback=_progress, file_modes=file_modes,
+                                                token_counter=token_counter, history=ConfigManager().last_documents, changes_only=changes_only)
+    finally:
+        if token_counter: token_counter.shutdown()
+    return {"output_file": output_file, "output_files": output_files, "files": stats["files"], "bytes": stats["bytes"]}
+
+# --- Batch Generation ---
+BATCH_JOB_KEYS = ("project", "output", "prompt", "prompt_file", "include", "exclude", "selection", "changes_only", "settings")
+
+def load_batch_manifest(manifest_path):
+    """
+    Reads a batch manifest: {"defaults": {...}, "jobs": [{...}, ...]}, where each job (on top of the defaults) has
+    a "project" and may set "output", "prompt" or "prompt_file", "include" globs, "exclude" patterns, "selection"
+    ("saved" for the project's saved tree state, or an {"include": [...], "exclude": [...]} state), "changes_only"
+    and "settings" overrides. Relative paths are relative to the manifest. Returns the jobs ready for run_batch;
+    raises ValueError for a malformed manifest.
+    """
+    with open(manifest_path, "r", encoding="utf-8") as f:
+        try: manifest = json.load(f)
+        except ValueError as e: raise ValueError(f"{manifest_path} is not valid JSON: {e}")
+    if not isinstance(manifest, dict) or not isinstance(manifest.get("jobs"), list): raise ValueError(f"{manifest_path} has no \"jobs\" list")
+    defaults = manifest.get("defaults") or {}
+    base_dir = os.path.dirname(os.path.abspath(manifest_path)); jobs = []; outputs = {}
+    for number, entry in enumerate(manifest["jobs"], 1):
+        if not isinstance(entry, dict): raise ValueError(f"job {number} is not an object")
+        unknown = (set(entry) | set(defaults)) - set(BATCH_JOB_KEYS)
+        if unknown: raise ValueError(f"job {number} has unknown keys: {', '.join(sorted(unknown))}")
+        entry = {**defaults, **entry, "settings": {**(defaults.get("settings") or {}), **(entry.get("settings") or {})}}
+        if not entry.get("project"): raise ValueError(f"job {number} has no \"project\"")
+        project_path = os.path.join(base_dir, os.path.expanduser(entry["project"]))
+        output_file = os.path.join(base_dir, os.path.expanduser(entry.get("output") or f"{os.path.basename(os.path.normpath(project_path))}_context.md"))
+        if os.path.normcase(output_file) in outputs: raise ValueError(f"jobs {outputs[os.path.normcase(output_file)]} and {number} both write {output_file}")
+        outputs[os.path.normcase(output_file)] = number
+        prompt_text = entry.get("prompt") or ""
+        if entry.get("prompt_file"):
+            with open(os.path.join(base_dir, entry["prompt_file"]), "r", encoding="utf-8") as f: prompt_text = f.read()
+        selection = entry.get("selection")
+        if selection is not None and selection != "saved" and not isinstance(selection, dict): raise ValueError(f"job {number}: \"selection\" must be \"saved\" or a tree state object")
+        jobs.append({"number": number, "project": project_path, "output": output_file, "prompt": prompt_text, "include": entry.get("include") or None, "exclude": entry.get("exclude") or None,
+                     "selection": selection, "changes_only": bool(entry.get("changes_only")), "settings": entry["settings"]})
+    return jobs
+
+def _run_batch_job(job, settings):
+    """
+    Generates one batch job's document in a pool process. Returns a result dict; failures are reported in its
+    "error" entry rather than raised, so one bad project does not stop the batch.
+    """
+    started = time.perf_counter()
+    result = {"number": job["number"], "project": job["project"], "output_files": [], "files": 0, "bytes": 0, "output_bytes": 0, "error": None}
+    try:
+        if not os.path.isdir(job["project"]): raise ValueError(f"not a directory: {job['project']}")
+        os.makedirs(os.path.dirname(job["output"]), exist_ok=True)
+        tree_state = job["selection"]
+        if tree_state == "saved":
+            tree_state = ConfigManager().tree_states.load(get_long_path_name(os.path.abspath(job["project"])))
+            if not tree_state: raise ValueError("no saved tree state for this project")
+        summary = build_context_document(job["project"], job["output"], job["prompt"], job["include"], job["exclude"], {**settings, **job["settings"]}, job["changes_only"], tree_state)
+        result.update(output_files=summary["output_files"], files=summary["files"], bytes=summary["bytes"], output_bytes=sum(os.path.getsize(path) for path in summary["output_files"]))
+    except Exception as e: result["error"] = str(e)
+    result["seconds"] = time.perf_counter() - started
+    return result
+
+def run_batch(jobs, settings, max_workers=None, on_result=None):
+    """
+    Generates every job's document concurrently on a process pool (one process per CPU by default), so
+    throughput scales with the number of cores. `on_result` is called with each result as its job finishes.
+    Returns the results in job order.
+    """
+    if not jobs: return []
+    max_workers = max(1, min(len(jobs), max_workers or os.cpu_count() or 1)); results = []
+    with ProcessPoolExecutor(max_workers=max_workers) as pool:
+        futures = {pool.submit(_run_batch_job, job, settings): job for job in jobs}
+        for future in as_completed(futures):
+            # A worker that dies (or a broken pool) fails its job rather than the whole batch
+            try: result = future.result()
+            except Exception as e:
+                job = futures[future]
+                result = {"number": job["number"], "project": job["project"], "output_files": [], "files": 0, "bytes": 0, "output_bytes": 0, "seconds": 0.0, "error": f"worker failed: {e}"}
+            results.append(result)
+            if on_result: on_result(result)
+    return sorted(results, key=operator.itemgetter("number"))
+
+def format_batch_summary(results, elapsed):
+    """
+    A plain-text table with one row per job (time, files, bytes read, document size) and a totals line.
+    """
+    rows = [f"{'#':>3}  {'Time':>8}  {'Files':>7}  {'Read':>9}  {'Output':>9}  Project"]
+    for result in results:
+        status = f"FAILED: {result['error']}" if result["error"] else os.path.basename(os.path.normpath(result["project"]))
+        rows.append(f"{result['number']:>3}  {result['seconds']:>7.2f}s  {result['files']:>7,}  {result['bytes'] / (1024 * 1024):>7.1f}MB  {result['output_bytes'] / (1024 * 1024):>7.1f}MB  {status}")
+    failed = sum(1 for result in results if result["error"]); busy = sum(result["seconds"] for result in results)
+    rows.append(f"{len(results) - failed} of {len(results)} documents written in {elapsed:.2f}s ({busy:.2f}s of job time, {busy / elapsed if elapsed else 0:.1f}x parallel)")
+    return "\n".join(rows)
+
+# --- Command Line Entry Point ---
+def is_cli_invocation(argv):
+    """
+    The GUI only takes an optional project path; any option switches to command line mode.
+    """
+    return any(arg.startswith('-') for arg in argv)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="llm-sherpa", description="Package a project into a single Markdown context document without starting the GUI.")
+    parser.add_argument("project_path", nargs="?", help="Project root folder")
+    parser.add_argument("-o", "--output", help="Output Markdown file (default: <project>_context.md in the current folder)")
+    parser.add_argument("-p", "--prompt", default="", help="Objective/prompt placed at the top of the document")
+    parser.add_argument("--prompt-file", help="Read the objective/prompt from a file")
+    parser.add_argument("-i", "--include", action="append", metavar="GLOB", help="Only include files whose project-relative path matches GLOB (repeatable)")
+    parser.add_argument("-x", "--exclude", action="append", metavar="PATTERN", help="Exclude files/folders matching this name or gitignore-style pattern, in addition to the settings (repeatable)")
+    parser.add_argument("--settings", metavar="FILE", help="settings.json to use instead of the one next to the application")
+    parser.add_argument("--git-index", action="store_true", help="List only the files tracked in the project's git index (falls back to a folder scan outside git checkouts)")
+    parser.add_argument("--skeleton", action="store_true", help="Write Python files as skeletons: imports, constants, signatures and docstrings")
+    parser.add_argument("--max-tokens", type=int, metavar="N", help="Split the document into balanced parts of at most N tokens (<output>_partNN.md)")
+    parser.add_argument("--keep-duplicates", action="store_true", help="Write every copy of files with identical content in full")
+    parser.add_argument("--max-file-kb", type=int, metavar="KB", help="Truncate files over this size to their head and tail (0 = no limit)")
+    parser.add_argument("--changes-only", action="store_true", help="Only write files added or modified since the last document written to the same output file, after a manifest of the changes")
+    parser.add_argument("--no-structure", action="store_true", help="Leave out the 'Project Structure' tree")
+    parser.add_argument("--trace", metavar="FILE", help="Record timing spans and counters and write them to FILE as a Chrome trace")
+    parser.add_argument("--batch", metavar="MANIFEST", help="Generate every document listed in a JSON manifest in parallel, then print a summary")
+    parser.add_argument("-j", "--jobs", type=int, metavar="N", help="Documents generated at once with --batch (default: one per CPU)")
+    parser.add_argument("--headless", action="store_true", help="Run without the GUI (implied by any other option)")
+    args = parser.parse_args(argv)
+
+    if args.batch:
+        single_options = [name for name, value in (("project_path", args.project_path), ("--output", args.output), ("--prompt", args.prompt), ("--prompt-file", args.prompt_file), ("--include", args.include), ("--trace", args.trace)) if value]
+        if single_options: parser.error(f"{', '.join(single_options)} cannot be combined with --batch; set them per job in the manifest")
+    elif not args.project_path: parser.error("a project folder or --batch MANIFEST is required")
+    elif not os.path.isdir(args.project_path): parser.error(f"not a directory: {args.project_path}")
+    if args.settings:
+        # Relative to the current folder, and never replaced with defaults: SettingsManager rewrites files it cannot load
+        args.settings = os.path.abspath(args.settings)
+        try:
+            with open(args.settings, "r") as f: json.load(f)
+        except OSError as e: parser.error(f"cannot read settings file {args.settings}: {e.strerror}")
+        except ValueError as e: parser.error(f"settings file {args.settings} is not valid JSON: {e}")
+    prompt_text = args.prompt
+    if args.prompt_file:
+        try:
+            with open(args.prompt_file, "r", encoding="utf-8") as f: prompt_text = f.read()
+        except OSError as e: parser.error(f"cannot read prompt file {args.prompt_file}: {e.strerror}")
+        except UnicodeDecodeError: parser.error(f"prompt file {args.prompt_file} is not UTF-8 text")
+    settings = SettingsManager(args.settings).settings if args.settings else SettingsManager().settings
+    if args.no_structure: settings["show_project_structure"] = False
+    if args.git_index: settings["use_git_index"] = True
+    if args.skeleton: settings["output_mode"] = "skeleton"
+    if args.keep_duplicates: settings["deduplicate_files"] = False
+    if args.max_file_kb is not None: settings["max_file_kb"] = max(0, args.max_file_kb)
+    if args.max_tokens is not None: settings["max_tokens_per_part"] = max(0, args.max_tokens)
+    if args.batch: return run_batch_command(args.batch, settings, args.jobs, args.exclude, args.changes_only)
+    output_file = args.output or f"{os.path.basename(os.path.normpath(os.path.abspath(args.project_path)))}_context.md"
+    started = time.perf_counter()
+    if args.trace: profiler.clear(); profiler.enable()
+    try:
+        summary = build_context_document(args.project_path, output_file, prompt_text, args.include, args.exclude, settings, args.changes_only)
+    except Exception as e:
+        print(f"Error: Failed to generate documentation: {e}", file=sys.stderr); return 1
+    finally:
+        if args.trace: profiler.export_chrome_trace(args.trace)
+    written_to = summary['output_file'] if len(summary['output_files']) == 1 else f"{len(summary['output_files'])} parts ({summary['output_files'][0]} ...)"
+    print(f"Wrote {summary['files']:,} files ({summary['bytes'] / (1024 * 1024):.1f} MB) to {written_to} in {time.perf_counter() - started:.2f}s")
+    return 0
+
+def run_batch_command(manifest_path, settings, max_workers=None, exclude_names=None, changes_only=False):
+    """
+    --batch: runs a manifest's jobs, reporting each as it finishes, and prints the summary table. Command line
+    options apply to every job; a job's own "settings" take precedence. Returns 1 if any job failed.
+    """
+    try: jobs = load_batch_manifest(manifest_path)
+    except (OSError, ValueError) as e: print(f"Batch Error: Could not read manifest: {e}", file=sys.stderr); return 1
+    for job in jobs:
+        if exclude_names: job["exclude"] = list(job["exclude"] or []) + list(exclude_names)
+        job["changes_only"] = job["changes_only"] or changes_only
+    finished = itertools.count(1)
+    def _report(result): print(f"[{next(finished)}/{len(jobs)}] {'failed' if result['error'] else 'done'}: {result['project']} ({result['seconds']:.2f}s)", file=sys.stderr)
+    started = time.perf_counter()
+    results = run_batch(jobs, settings, max_workers, on_result=_report)
+    print(format_batch_summary(results, time.perf_counter() - started))
+    return 1 if any(result["error"] for result in results) else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
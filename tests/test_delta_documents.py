@@ -0,0 +1,56 @@
+import os
+
+from sherpa_core import ProjectStateStore, SettingsManager, write_markdown_document
+
+
+def make_project(root):
+    for rel_path, text in {"src/a.py": "a = 1\n", "src/b.py": "b = 1\n", "docs/guide.md": "# Guide\n", "docs/notes.md": "notes\n"}.items():
+        path = root / rel_path; path.parent.mkdir(parents=True, exist_ok=True); path.write_text(text)
+
+
+def generate(project, output, files, history):
+    settings = SettingsManager().settings
+    write_markdown_document(str(output), str(project), [str(project / f) for f in files], "", settings, history=history, changes_only=True)
+    return output.read_text()
+
+
+def test_outputs_of_one_project_keep_separate_histories(tmp_path):
+    project = tmp_path / "proj"; make_project(project); history = ProjectStateStore(str(tmp_path / "history"), "Document History")
+    src, docs = ["src/a.py", "src/b.py"], ["docs/guide.md", "docs/notes.md"]
+    for _ in range(2):
+        src_doc = generate(project, tmp_path / "src.md", src, history)
+        docs_doc = generate(project, tmp_path / "docs.md", docs, history)
+    for document in (src_doc, docs_doc):
+        assert "0 added, 0 modified, 0 removed; 2 unchanged" in document
+
+
+def test_only_deleted_files_are_listed_as_removed(tmp_path):
+    project = tmp_path / "proj"; make_project(project); history = ProjectStateStore(str(tmp_path / "history"), "Document History")
+    generate(project, tmp_path / "out.md", ["src/a.py", "src/b.py", "docs/notes.md"], history)
+    os.remove(project / "src" / "b.py"); (project / "src" / "a.py").write_text("a = 22\n")
+    document = generate(project, tmp_path / "out.md", ["src/a.py"], history)
+    assert "| removed | `src/b.py` |" in document and "docs/notes.md" not in document
+    assert "| modified | `src/a.py` |" in document and "a = 22" in document
+
+
+
+def test_files_are_read_once_and_oversized_files_never_in_full(tmp_path, monkeypatch):
+    import sherpa_core
+    project = tmp_path / "proj"; make_project(project); (project / "big.log").write_text("x" * 300_000)
+    history = ProjectStateStore(str(tmp_path / "history"), "Document History")
+    defaults = SettingsManager().settings
+    settings = dict(defaults, max_file_kb=64, extension_map=dict(defaults["extension_map"], **{".log": "text"}))
+    reads, hashed = [], []
+    real_read, real_digest = sherpa_core.read_source_text, sherpa_core.file_digest
+    monkeypatch.setattr(sherpa_core, "read_source_text", lambda path, *args: reads.append(path) or real_read(path, *args))
+    monkeypatch.setattr(sherpa_core, "file_digest", lambda path: hashed.append(path) or real_digest(path))
+    files = [str(project / f) for f in ("src/a.py", "src/b.py", "big.log")]
+    write_markdown_document(str(tmp_path / "out.md"), str(project), files, "", settings, history=history)
+    assert sorted(reads) == sorted(files) and hashed == []
+
+    with open(project / "big.log", "r+") as f: f.seek(150_000); f.write("y")  # only the omitted middle changes
+    (project / "src" / "a.py").write_text("a = 3\n")
+    write_markdown_document(str(tmp_path / "out.md"), str(project), files, "", settings, history=history, changes_only=True)
+    document = (tmp_path / "out.md").read_text()
+    assert "| modified | `src/a.py` |" in document and "big.log" not in document
+    assert str(project / "big.log") not in hashed
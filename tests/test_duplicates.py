@@ -0,0 +1,13 @@
+import sherpa_core
+from sherpa_core import find_duplicate_files
+
+
+def test_duplicates_are_only_read_in_full_when_their_heads_match(tmp_path, monkeypatch):
+    body = "".join(f"line {i:05d}\n" for i in range(2000))
+    paths = [tmp_path / name for name in ("a.txt", "b.txt", "c.txt", "d.txt")]
+    for path, head in zip(paths, "AABC"): path.write_text(head + body)
+    hashed = []; real_digest = sherpa_core.file_digest
+    monkeypatch.setattr(sherpa_core, "file_digest", lambda path: hashed.append(path) or real_digest(path))
+    files = [str(path) for path in paths]
+    assert find_duplicate_files(files) == {files[1]: files[0]}
+    assert hashed == files[:2]
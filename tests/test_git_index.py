@@ -0,0 +1,61 @@
+import shutil
+import subprocess
+
+import pytest
+
+from sherpa_core import GitIndex, SettingsManager, git_listings, list_directory_items, scan_project
+
+pytestmark = pytest.mark.skipif(shutil.which("git") is None, reason="needs the git binary to build indexes")
+
+
+def git(repo, *args):
+    subprocess.run(["git", "-c", "user.name=test", "-c", "user.email=test@example.com", *args], cwd=repo, check=True, capture_output=True)
+
+
+@pytest.fixture
+def repo(tmp_path):
+    (tmp_path / "src" / "pkg").mkdir(parents=True)
+    for rel in ["README.md", "src/main.py", "src/pkg/core.py", "src/pkg/util.py"]: (tmp_path / rel).write_text(f"# {rel}\n")
+    git(tmp_path, "init", "-q"); git(tmp_path, "add", "."); git(tmp_path, "commit", "-q", "-m", "init")
+    return tmp_path
+
+
+def tracked_files(path):
+    settings = dict(SettingsManager().settings, use_git_index=True, use_gitignore=False)
+    return sorted(item["rel_path"] for item in scan_project(str(path), settings) if not item["is_dir"])
+
+
+@pytest.mark.parametrize("version", [2, 3, 4])
+def test_every_index_version_lists_the_same_paths(repo, version):
+    if version >= 3: (repo / "src" / "pkg" / "new.py").write_text("# new\n"); git(repo, "add", "-N", "src/pkg/new.py")  # intent-to-add sets extended flags
+    git(repo, "update-index", "--index-version", str(version))
+    assert (repo / ".git" / "index").read_bytes()[4:8] == version.to_bytes(4, "big")
+    index = GitIndex.find(str(repo)); new = ["new.py"] if version >= 3 else []
+    assert [path for path, _ in index.entries()] == ["README.md", "src/main.py", "src/pkg/core.py", *("src/pkg/" + name for name in new), "src/pkg/util.py"]
+    assert index.listings(str(repo / "src")) == {".": [("main.py", False), ("pkg", True)], "pkg": sorted((name, False) for name in ["core.py", "util.py", *new])}
+
+
+@pytest.mark.parametrize("version", [3, 4])
+def test_skip_worktree_entries_are_left_out(repo, version):
+    git(repo, "update-index", "--index-version", str(version)); git(repo, "update-index", "--skip-worktree", "src/main.py")
+    assert [path for path, _ in GitIndex.find(str(repo)).entries()] == ["README.md", "src/pkg/core.py", "src/pkg/util.py"]
+    assert tracked_files(repo) == ["README.md", "src/pkg/core.py", "src/pkg/util.py"]
+
+
+def test_deleted_tracked_files_are_left_out(repo):
+    (repo / "src" / "pkg" / "util.py").unlink()
+    assert tracked_files(repo) == ["README.md", "src/main.py", "src/pkg/core.py"]
+
+
+def test_untracked_folder_inside_a_checkout_is_scanned(repo):
+    (repo / "scratch" / "notes").mkdir(parents=True); (repo / "scratch" / "a.txt").write_text("a\n"); (repo / "scratch" / "notes" / "b.txt").write_text("b\n")
+    assert GitIndex.find(str(repo / "scratch")).listings(str(repo / "scratch")) is None
+    assert tracked_files(repo / "scratch") == ["a.txt", "notes/b.txt"]
+
+
+def test_relisting_a_folder_from_the_index_leaves_untracked_files_out(repo):
+    (repo / "src" / "scratch.py").write_text("# untracked\n")
+    settings = dict(SettingsManager().settings, use_git_index=True, use_gitignore=False)
+    listings = git_listings(str(repo), settings)
+    assert [item["name"] for item in list_directory_items(str(repo), "src", settings, listings)] == ["main.py", "pkg"]
+    assert git_listings(str(repo), dict(settings, use_git_index=False)) is None
@@ -0,0 +1,68 @@
+import random
+
+from sherpa_core import plan_parts
+
+
+def greedy_part_count(costs, budget):
+    parts, load = 0, None
+    for cost in costs:
+        if load is None or load + cost > budget: parts += 1; load = 0
+        load += cost
+    return parts
+
+
+def test_oversized_files_do_not_push_other_parts_over_budget():
+    for costs in ([1000, 60, 60, 1000], [500, 40, 40, 40, 500]):
+        ranges = plan_parts(costs, 100)
+        for start, end in ranges:
+            assert end - start == 1 or sum(costs[start:end]) <= 100
+
+
+def test_random_costs_stay_within_budget_with_fewest_parts():
+    rng = random.Random(0)
+    for _ in range(2000):
+        budget = rng.randint(1, 500)
+        costs = [rng.choice([rng.randint(0, budget), rng.randint(budget, 3 * budget)]) for _ in range(rng.randint(0, 30))]
+        ranges = plan_parts(costs, budget)
+        assert [i for start, end in ranges for i in range(start, end)] == list(range(len(costs)))
+        assert len(ranges) == greedy_part_count(costs, budget)
+        for start, end in ranges:
+            assert end - start == 1 or sum(costs[start:end]) <= budget
+
+
+def test_rewriting_with_fewer_parts_removes_stale_part_files(tmp_path):
+    from sherpa_core import SettingsManager, write_markdown_document
+    project = tmp_path / "proj"; project.mkdir()
+    files = []
+    for n in range(6):
+        path = project / f"m{n}.py"; path.write_text(f"value_{n} = '{'x' * 2000}'\n"); files.append(str(path))
+    output = tmp_path / "out" / "context.md"; output.parent.mkdir(); (output.parent / "context_notes.md").write_text("keep")
+    settings = dict(SettingsManager().settings, deduplicate_files=False)
+    def names(): return sorted(p.name for p in output.parent.iterdir())
+
+    written = write_markdown_document(str(output), str(project), files, "", dict(settings, max_tokens_per_part=700))
+    assert len(written) > 2 and names() == sorted(["context_notes.md"] + [f"context_part{n:02d}.md" for n in range(1, len(written) + 1)])
+    written = write_markdown_document(str(output), str(project), files[:3], "", dict(settings, max_tokens_per_part=700))
+    assert names() == sorted(["context_notes.md"] + [f"context_part{n:02d}.md" for n in range(1, len(written) + 1)])
+    write_markdown_document(str(output), str(project), files, "", settings)
+    assert names() == ["context.md", "context_notes.md"]
+    write_markdown_document(str(output), str(project), files, "", dict(settings, max_tokens_per_part=700))
+    assert "context.md" not in names()
+
+
+def test_unrelated_files_named_like_parts_survive(tmp_path):
+    from sherpa_core import SettingsManager, write_markdown_document
+    project = tmp_path / "proj"; project.mkdir()
+    files = []
+    for n in range(6):
+        path = project / f"m{n}.py"; path.write_text(f"value_{n} = '{'x' * 2000}'\n"); files.append(str(path))
+    unrelated = {"notes_part01.md": "# My notes\n", "notes_part07.md": "## 📚 Project Context: `other` (part 3 of 9)\n"}
+    for name, text in unrelated.items(): (project / name).write_text(text)
+    settings = dict(SettingsManager().settings, deduplicate_files=False)
+    write_markdown_document(str(project / "notes.md"), str(project), files, "", settings)
+    for name, text in unrelated.items(): assert (project / name).read_text() == text
+    written = write_markdown_document(str(project / "notes.md"), str(project), files, "Objective", dict(settings, max_tokens_per_part=700))
+    assert len(written) < 7 and (project / "notes_part07.md").read_text() == unrelated["notes_part07.md"]
+    (project / "notes.md").write_text("user file, not a generated document\n")
+    write_markdown_document(str(project / "notes.md"), str(project), files, "", dict(settings, max_tokens_per_part=700))
+    assert (project / "notes.md").exists()
@@ -0,0 +1,22 @@
+import glob
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+from sherpa_core import ProjectStateStore
+
+
+def save_projects(state_dir, first, count):
+    store = ProjectStateStore(state_dir)
+    for n in range(first, first + count): store.save(f"/projects/p{n:03d}", {"n": n}, max_projects=40)
+
+
+def test_parallel_saves_keep_the_recent_list_and_the_bound(tmp_path):
+    state_dir = str(tmp_path / "states")
+    with ProcessPoolExecutor(max_workers=4) as pool:
+        for future in [pool.submit(save_projects, state_dir, first, 25) for first in range(0, 100, 25)]: future.result()
+    with open(os.path.join(state_dir, "recent.json")) as f: recent = json.load(f)["recent"]
+    assert len(recent) == len(set(recent)) == 40
+    assert len(glob.glob(os.path.join(state_dir, "*.json"))) == 40 + 1
+    store = ProjectStateStore(state_dir)
+    assert all(store.load(project) == {"n": int(project[-3:])} for project in recent)
@@ -0,0 +1,59 @@
+from sherpa_core import python_skeleton
+
+SOURCE = '''
+"""Compat module."""
+import sys
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from collections.abc import Iterator
+
+try:
+    import ujson as json
+except ImportError:
+    import json
+
+    class Fallback:
+        def loads(self, text):
+            return json.loads(text)
+
+if sys.version_info >= (3, 11):
+    def parse(text) -> dict:
+        """Parses text."""
+        return json.loads(text)
+else:
+    def parse(text):
+        return {}
+
+with open(__file__) as f:
+    HEADER = f.readline()
+
+if sys.platform == "win32":
+    print("windows")
+
+if __name__ == "__main__":
+    args = sys.argv[1:]
+    parse(args[0])
+'''
+
+
+def test_definitions_inside_if_try_with_are_kept():
+    skeleton = python_skeleton(SOURCE)
+    compile(skeleton, "<skeleton>", "exec")
+    for expected in ("if TYPE_CHECKING:", "from collections.abc import Iterator", "import ujson as json", "except ImportError:",
+                     "class Fallback:", "def loads(self, text):", "if sys.version_info >= (3, 11):", "def parse(text) -> dict:",
+                     '"""Parses text."""', "else:", "with open(__file__) as f:", "HEADER = f.readline()"):
+        assert expected in skeleton
+    assert "return json.loads(text)" not in skeleton
+
+
+def test_blocks_without_definitions_and_main_guard_are_dropped():
+    skeleton = python_skeleton(SOURCE)
+    assert "win32" not in skeleton and "print" not in skeleton
+    assert "__main__" not in skeleton and "args" not in skeleton
+
+
+def test_try_with_only_finally_stays_valid():
+    skeleton = python_skeleton("try:\n    import fast\nfinally:\n    cleanup()\n")
+    compile(skeleton, "<skeleton>", "exec")
+    assert "import fast" in skeleton
@@ -0,0 +1,14 @@
+import re
+
+from sherpa_core import SettingsManager, read_source_text
+
+
+def test_truncation_stays_within_a_limit_below_head_plus_tail(tmp_path):
+    path = tmp_path / "big.txt"; path.write_text("".join(f"line {i:05d} of the file\n" for i in range(1900)))
+    settings = dict(SettingsManager().settings, max_file_kb=32, truncated_head_kb=48, truncated_tail_kb=16)
+    assert path.stat().st_size > 32 * 1024
+    text, bytes_read, kind = read_source_text(str(path), settings)
+    assert kind == "truncated" and bytes_read <= 32 * 1024
+    omitted = int(re.search(r"\[([\d,]+) bytes omitted\]", text).group(1).replace(",", ""))
+    assert omitted > 0 and omitted + bytes_read == path.stat().st_size
+    assert text.startswith("line 00000") and text.rstrip().endswith("line 01899 of the file")
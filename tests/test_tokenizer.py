@@ -0,0 +1,12 @@
+import base64
+import importlib.util
+
+from sherpa_core import BPETokenizer
+
+
+def test_counts_are_exact_only_with_a_unicode_aware_split(tmp_path):
+    vocab = tmp_path / "cl100k_base.tiktoken"
+    vocab.write_bytes(b"".join(base64.b64encode(bytes([i])) + b" %d\n" % i for i in range(256)))
+    tokenizer = BPETokenizer(str(vocab))
+    assert tokenizer.exact == any(importlib.util.find_spec(name) for name in ("tiktoken", "regex"))
+    assert tokenizer.count("abc def") == 7